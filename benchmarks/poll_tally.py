@@ -0,0 +1,42 @@
+"""Benchmark the counting of votes of synthetic polls of up to 20 options and 10k voters."""
+
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, '.')  # Run from the root directory: `python benchmarks/poll_tally.py`
+
+from zbot import tally  # noqa: E402
+
+OPTIONS_NUMBERS = [2, 5, 10, 20]
+VOTERS_NUMBERS = [100, 1000, 10000]
+MAX_OPTIONS_PER_VOTER = 3
+REPEAT = 5
+
+
+def make_tally(options_number, voters_number, rng):
+    vote_tally = tally.VoteTally(range(options_number))
+    for voter_id in range(voters_number):
+        voter_options_number = rng.randint(1, min(MAX_OPTIONS_PER_VOTER, options_number))
+        for option_code in rng.sample(range(options_number), voter_options_number):
+            vote_tally.add_vote(option_code, voter_id)
+    return vote_tally
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'options':>8} {'voters':>8} {'multiple (ms)':>14} {'exclusive (ms)':>15}")
+    for options_number in OPTIONS_NUMBERS:
+        for voters_number in VOTERS_NUMBERS:
+            vote_tally = make_tally(options_number, voters_number, rng)
+            timings = []
+            for is_exclusive in (False, True):
+                start = perf_counter()
+                for _ in range(REPEAT):
+                    vote_tally.count(is_exclusive, lambda voter_id: voter_id % 10 != 0)  # 10% of invalid voters
+                timings.append((perf_counter() - start) / REPEAT * 1000)
+            print(f"{options_number:>8} {voters_number:>8} {timings[0]:>14.2f} {timings[1]:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import datetime
+import typing
+
+import discord
+
+from . import converter
+
+
+class ChannelActivity(typing.NamedTuple):
+    message_id: int
+    author_id: int
+    time: datetime.datetime  # Localized in UTC
+
+
+class ChannelActivityTracker:
+
+    """
+    Record of the last message posted in each channel, fed by the message events.
+
+    Channels are only tracked from their first message seen by the bot. Untracked channels are bootstrapped from their
+    history once, when first queried.
+    """
+
+    def __init__(self):
+        self._last_activities = {}  # {channel_id: channel_activity}
+
+    def record(self, message: discord.Message):
+        self._last_activities[message.channel.id] = ChannelActivity(
+            message.id, message.author.id, converter.to_utc(message.created_at)
+        )
+
+    def forget(self, channel_id: int, message_id: int):
+        """Untrack the channel if its last message was deleted, as the previous one is unknown."""
+        if (last_activity := self._last_activities.get(channel_id)) and last_activity.message_id == message_id:
+            del self._last_activities[channel_id]
+
+    async def get_last_activity(self, channel: discord.TextChannel) -> ChannelActivity or None:
+        if channel.id not in self._last_activities:
+            if last_messages := await channel.history(limit=1).flatten():
+                self.record(last_messages[0])
+        return self._last_activities.get(channel.id)
+
+    async def get_quiet_time(self, channel: discord.TextChannel, wait: datetime.timedelta) -> datetime.datetime:
+        """Return the time from which the channel is quiet if no message is posted until then."""
+        if last_activity := await self.get_last_activity(channel):
+            return last_activity.time + wait
+        return converter.to_utc(datetime.datetime.min)
@@ -0,0 +1,96 @@
+import datetime
+import typing
+
+from . import draw_engine
+from . import logger
+
+DEFAULT_WEIGHT = 1
+
+
+class AutomessageCatalogue:
+
+    """
+    Local cache of the automessages indexed by automessage id, loaded once and updated on each write.
+
+    Removing an automessage shifts the ids of the following ones, so that new ids are kept contiguous. Each write to the
+    catalogue is forwarded to the database, so that the collection is only read at startup.
+    """
+
+    DATA_KEYS = ['_id', 'automessage_id', 'channel_id', 'message', 'weight']
+
+    def __init__(self, db):
+        """:param db: The database connector to persist the automessages with"""
+        self.db = db
+        self._automessages_data = {}  # {automessage_id: automessage_data}
+        self.last_automessage_id = None
+        self.last_automessage_date = None
+
+    def load(self):
+        self._automessages_data = {
+            automessage_data['automessage_id']: automessage_data
+            for automessage_data in self.db.load_automessages({}, self.DATA_KEYS)
+        }
+        self.last_automessage_id = self.db.get_metadata('last_automessage_id')
+        self.last_automessage_date = self.db.get_metadata('last_automessage_date')
+        logger.debug(f"Loaded {len(self._automessages_data)} automessage(s).")
+
+    def __contains__(self, automessage_id) -> bool:
+        return automessage_id in self._automessages_data
+
+    def __len__(self) -> int:
+        return len(self._automessages_data)
+
+    def get(self, automessage_id: int) -> dict or None:
+        return self._automessages_data.get(automessage_id)
+
+    def values(self) -> typing.List[dict]:
+        """Return the automessages data ordered by automessage id."""
+        return [self._automessages_data[automessage_id] for automessage_id in sorted(self._automessages_data)]
+
+    def get_next_automessage_id(self) -> int:
+        return max(self._automessages_data, default=0) + 1  # Ids of older databases may have gaps
+
+    def add(self, message: str, channel_id: int, weight=DEFAULT_WEIGHT) -> int:
+        automessage_id = self.get_next_automessage_id()
+        document_id = self.db.insert_automessage(automessage_id, message, channel_id, weight)
+        self._automessages_data[automessage_id] = {
+            '_id': document_id, 'automessage_id': automessage_id, 'channel_id': channel_id, 'message': message,
+            'weight': weight,
+        }
+        return automessage_id
+
+    def update(self, automessage_id: int, automessage_data: dict):
+        self.db.update_automessages({self._automessages_data[automessage_id]['_id']: automessage_data})
+        self._automessages_data[automessage_id].update(automessage_data)
+
+    def remove(self, automessage_id: int):
+        """Remove the automessage and renumber the following ones in a single batch of writes."""
+        removed_automessage_data = self._automessages_data.pop(automessage_id)
+        renumbered_automessages_data = {}
+        for shifted_automessage_id in sorted(i for i in self._automessages_data if i > automessage_id):
+            automessage_data = self._automessages_data.pop(shifted_automessage_id)
+            automessage_data['automessage_id'] = shifted_automessage_id - 1
+            self._automessages_data[shifted_automessage_id - 1] = automessage_data
+            renumbered_automessages_data[automessage_data['_id']] = {'automessage_id': shifted_automessage_id - 1}
+        self.db.delete_automessage(removed_automessage_data['_id'], renumbered_automessages_data)
+        if self.last_automessage_id is not None and self.last_automessage_id >= automessage_id:
+            # Follow the renumbering, or forget the last automessage if it was removed
+            self.last_automessage_id = self.last_automessage_id - 1 if self.last_automessage_id > automessage_id \
+                else None
+            self.db.update_metadata('last_automessage_id', self.last_automessage_id)
+
+    def pick(self) -> dict or None:
+        """Draw an automessage with a probability proportional to its weight, other than the last one if possible."""
+        candidates_data = [
+            automessage_data for automessage_id, automessage_data in self._automessages_data.items()
+            if automessage_id != self.last_automessage_id  # Don't post the same message twice in a row
+        ] or list(self._automessages_data.values())  # At most a single automessage exists, pick it anyway
+        if not candidates_data:  # No automessage exists
+            return None
+        weights = [automessage_data.get('weight', DEFAULT_WEIGHT) for automessage_data in candidates_data]
+        return draw_engine.Draw().weighted_sample(candidates_data, weights, 1)[0]
+
+    def record_post(self, automessage_id: int, time: datetime.datetime):
+        self.db.update_metadata('last_automessage_id', automessage_id)
+        self.db.update_metadata('last_automessage_date', time)
+        self.last_automessage_id, self.last_automessage_date = automessage_id, time
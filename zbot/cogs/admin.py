@@ -8,7 +8,9 @@ from discord.ext import commands
 
 from zbot import checker
 from zbot import converter
+from zbot import dispatcher
 from zbot import exceptions
+from zbot import recruitment
 from zbot import utils
 from zbot import wot_utils
 from zbot import zbot
@@ -35,14 +37,31 @@ class Admin(_command.Command):
     WORK_IN_PROGRESS_EMOJI = '👀'
     WORK_DONE_EMOJI = '✅'
 
+    recruitment_mirror = recruitment.RecruitmentMirror(zbot.db)
+
     def __init__(self, bot):
         super().__init__(bot)
-        bot.loop.create_task(self.record_recruitment_announces())
+        self.recruitment_mirror.start(self.guild.get_channel(self.RECRUITMENT_CHANNEL_ID))
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.channel.id == self.RECRUITMENT_CHANNEL_ID:
+            self.recruitment_mirror.record(message)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if payload.channel_id == self.RECRUITMENT_CHANNEL_ID:
+            self.recruitment_mirror.update(payload.message_id, payload.data)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.channel_id == self.RECRUITMENT_CHANNEL_ID:
+            self.recruitment_mirror.remove(payload.message_id)
 
-    async def record_recruitment_announces(self):
-        recruitment_channel = self.guild.get_channel(self.RECRUITMENT_CHANNEL_ID)
-        recruitment_announces = await recruitment_channel.history().flatten()
-        zbot.db.update_recruitment_announces(recruitment_announces)
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.channel_id == self.RECRUITMENT_CHANNEL_ID:
+            self.recruitment_mirror.remove(*payload.message_ids)
 
     @commands.group(
         name='check',
@@ -345,12 +364,9 @@ class Admin(_command.Command):
     ):
         add_reaction and await context.message.add_reaction(self.WORK_IN_PROGRESS_EMOJI)
 
-        recruitment_channel = self.guild.get_channel(self.RECRUITMENT_CHANNEL_ID)
-        recruitment_announces = await recruitment_channel.history(
-            after=after.replace(tzinfo=None),
-            limit=limit,
-            oldest_first=False  # Search in reverse in case the filters limit the results
-        ).flatten()
+        recruitment_announces = (await self.recruitment_mirror.get_announces(
+            after=after.replace(tzinfo=None)
+        ))[:limit]  # Search in reverse in case the filters limit the results
         recruitment_announces.reverse()  # Reverse again to have oldest match in first place
         recruitment_announces = list(filter(
             lambda a: not checker.has_any_mod_role(context, a.author, print_error=False)  # Ignore moderation messages
@@ -363,7 +379,7 @@ class Admin(_command.Command):
         await self.check_recruitment_announces_uniqueness(context, recruitment_announces)
         await self.check_recruitment_announces_length(context, recruitment_announces)
         await self.check_recruitment_announces_embeds(context, recruitment_announces)
-        await self.check_recruitment_announces_timespan(context, recruitment_channel, recruitment_announces)
+        await self.check_recruitment_announces_timespan(context, recruitment_announces)
 
         add_reaction and await context.message.remove_reaction(self.WORK_IN_PROGRESS_EMOJI, self.user)
         add_reaction and await context.message.add_reaction(self.WORK_DONE_EMOJI)
@@ -457,10 +473,8 @@ class Admin(_command.Command):
         return embedded_announces
 
     @staticmethod
-    async def check_recruitment_announces_timespan(context, channel, announces):
+    async def check_recruitment_announces_timespan(context, announces):
         """Check that no announce is re-posted before a given timespan."""
-        zbot.db.update_recruitment_announces(await channel.history().flatten())
-
         # Get records of all deleted announces
         # Still existing announces are handled by Admin.check_recruitment_announces_uniqueness
         author_last_announce_data = {}
@@ -536,8 +550,6 @@ class Admin(_command.Command):
             options += f" {member}"
             member = None
         require_contact_role = not utils.is_option_enabled(options, 'all')
-        recruitment_channel = self.guild.get_channel(self.RECRUITMENT_CHANNEL_ID)
-        zbot.db.update_recruitment_announces(await recruitment_channel.history().flatten())
 
         # Get the record of each author's last announce (deleted or not)
         author_last_announce_data = {}
@@ -632,19 +644,17 @@ class Admin(_command.Command):
     @commands.check(checker.has_any_mod_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def report_recruitment(self, context, target: typing.Union[discord.Member, int], *, options=""):
-        recruitment_channel = self.guild.get_channel(self.RECRUITMENT_CHANNEL_ID)
         if isinstance(target, discord.Member):
             author = target
-            all_recruitment_announces = await recruitment_channel.history(oldest_first=False).flatten()
-            recruitment_announces = list(filter(lambda a: a.author == author, all_recruitment_announces))
+            all_recruitment_announces = await self.recruitment_mirror.get_announces()
+            recruitment_announces = list(filter(lambda a: a.author_id == author.id, all_recruitment_announces))
             last_recruitment_announce = recruitment_announces and recruitment_announces[0]
         else:
             announce_id = target
-            last_recruitment_announce = await utils.try_get_message(
-                recruitment_channel, announce_id, error=exceptions.MissingMessage(announce_id)
-            )
+            if not (last_recruitment_announce := await self.recruitment_mirror.get_announce(announce_id)):
+                raise exceptions.MissingMessage(announce_id)
             recruitment_announces = [last_recruitment_announce]
-            author = last_recruitment_announce.author
+            author = await last_recruitment_announce.fetch_author()  # The author may have left the server
         clear = utils.is_option_enabled(options, 'clear')
 
         if not last_recruitment_announce:
@@ -662,48 +672,46 @@ class Admin(_command.Command):
             or self.send_buffer.pop()
         await self.check_recruitment_announces_embeds(patched_context, [last_recruitment_announce]) \
             or self.send_buffer.pop()
-        await self.check_recruitment_announces_timespan(
-            patched_context, recruitment_channel, [last_recruitment_announce]
-        ) or self.send_buffer.pop()
+        await self.check_recruitment_announces_timespan(patched_context, [last_recruitment_announce]) \
+            or self.send_buffer.pop()
 
         if not self.send_buffer:
             await context.send(f"L'annonce ne présente aucun problème. :ok_hand: ")
         else:
-            # DM author
-            await utils.try_dm(
-                author,
-                f"Bonjour. Il a été détecté que ton annonce de recrutement ne respectait pas le "
-                f"règlement du serveur. Voici un rapport de l'analyse effectuée: \n _ _"
-            )
-            await utils.try_dms(author, self.send_buffer, group_in_blocks=True)
-            await utils.try_dm(
-                author,
-                f"_ _ \n"
-                f"En attendant que le problème soit réglé, ton annonce a été supprimée.\n"
-                f"En cas de besoin, tu peux contacter {context.author.mention} qui a reçu une copie du "
-                f"rapport d'analyse.\n"
-                f"Pour éviter ce genre de désagrément, vérifie que ton annonce respecte le règlement en utilisant la "
-                f"commande `+valider annonce` dans le canal <#557870289292230666>.\n _ _"
-            )
-            await utils.try_dm(
-                author,
-                f"Copie du contenu de l'annonce:\n _ _ \n"
-                f">>> {last_recruitment_announce.content}"
-            )
-
-            # DM moderator
-            await utils.try_dm(context.author, f"Rapport d'analyse envoyé à {author.mention}: \n _ _")
-            await utils.try_dms(context.author, self.send_buffer, group_in_blocks=True)
-            await utils.try_dm(
-                context.author,
-                f"_ _ \n"
-                f"Copie du contenu de l'annonce:\n _ _ \n"
-                f">>> {last_recruitment_announce.content}"
-            )
+            # DM author, unless their account can't be found anymore, and moderator, concurrently
+            report_blocks = utils.make_message_blocks(self.send_buffer)
+            can_dm_author = isinstance(author, discord.abc.User)
+            await dispatcher.send_dms({
+                **({author: [
+                    f"Bonjour. Il a été détecté que ton annonce de recrutement ne respectait pas le "
+                    f"règlement du serveur. Voici un rapport de l'analyse effectuée: \n _ _",
+                    *report_blocks,
+                    f"_ _ \n"
+                    f"En attendant que le problème soit réglé, ton annonce a été supprimée.\n"
+                    f"En cas de besoin, tu peux contacter {context.author.mention} qui a reçu une copie du "
+                    f"rapport d'analyse.\n"
+                    f"Pour éviter ce genre de désagrément, vérifie que ton annonce respecte le règlement en utilisant "
+                    f"la commande `+valider annonce` dans le canal <#557870289292230666>.\n _ _",
+                    f"Copie du contenu de l'annonce:\n _ _ \n"
+                    f">>> {last_recruitment_announce.content}",
+                ]} if can_dm_author else {}),
+                context.author: [
+                    (f"Rapport d'analyse envoyé à {author.mention}: \n _ _" if can_dm_author
+                     else f"Rapport d'analyse de l'annonce de {author.mention}, au compte introuvable: \n _ _"),
+                    *report_blocks,
+                    f"_ _ \n"
+                    f"Copie du contenu de l'annonce:\n _ _ \n"
+                    f">>> {last_recruitment_announce.content}",
+                ],
+            })
 
             # Delete announce
             await last_recruitment_announce.delete()
-            await context.send(f"L'annonce a été supprimée et un rapport envoyé par MP. :ok_hand: ")
+            await context.send(
+                f"L'annonce a été supprimée et un rapport envoyé par MP. :ok_hand: " if can_dm_author
+                else f"L'annonce a été supprimée, mais son auteur est introuvable et n'a pas reçu le rapport. "
+                     f"Une copie t'a été envoyée par MP."
+            )
 
             # Clear announce tracking records
             if clear:
@@ -1,15 +1,18 @@
 import datetime
-import random
 import typing
 
 import discord
 from discord.ext import commands
+from discord.ext import tasks
 
 from zbot import checker
 from zbot import converter
+from zbot import dispatcher
+from zbot import draw_engine
 from zbot import error_handler
 from zbot import exceptions
 from zbot import logger
+from zbot import registry
 from zbot import scheduler
 from zbot import utils
 from zbot import zbot
@@ -28,18 +31,50 @@ class Lottery(_command.Command):
 
     ANNOUNCE_ROLE_NAME = 'Abonné Annonces'
     EMBED_COLOR = 0x77B255  # Four leaf clover green
+    PARTICIPANTS_FLUSH_FREQUENCY = datetime.timedelta(minutes=5)  # How often the participants are persisted
 
-    pending_lotteries = {}  # Local cache of lottery data for reactions check
+    # Local cache of lottery data for reactions check, with the eligible participants tallied as the only option
+    pending_lotteries = registry.PendingJobRegistry(
+        'lottery_id', zbot.db.update_lottery_data, get_option_codes=lambda lottery_data: [lottery_data['emoji_code']]
+    )
 
     def __init__(self, bot):
         super().__init__(bot)
         # Use class attribute to be available from static methods
-        Lottery.pending_lotteries = zbot.db.load_pending_lotteries_data(
+        Lottery.pending_lotteries.load(zbot.db.load_pending_lotteries_data(
             (
                 '_id', 'lottery_id', 'message_id', 'channel_id', 'emoji_code', 'nb_winners', 'next_run_time',
-                'organizer_id'
+                'organizer_id', 'tier_sizes', 'role_weights', registry.PendingJobRegistry.TALLY_KEY
             )
-        )
+        ))
+        bot.loop.create_task(self.reconcile_participants_tallies())
+        self.flush_participants_tallies.start()
+
+    async def reconcile_participants_tallies(self):
+        """Catch up with the participations registered while the bot was offline."""
+        for message_id, lottery_data in list(self.pending_lotteries.items()):
+            channel = self.guild.get_channel(lottery_data['channel_id'])
+            if message := await utils.try_get_message(channel, message_id):
+                # Participations both added and withdrawn offline can leave the count unchanged, refetch anyway
+                await self.reconcile_participants_tally(message, force=True)
+
+    @staticmethod
+    async def reconcile_participants_tally(message: discord.Message, force=False):
+        """
+        Refetch the participants if the reaction count doesn't match the tally.
+        :param force: Whether to refetch the participants regardless of the reaction count
+        """
+        participants_tally = Lottery.pending_lotteries.get_tally(message.id)
+        emoji_code = Lottery.pending_lotteries[message.id]['emoji_code']
+        if reaction := discord.utils.find(lambda r: utils.get_emoji_code(r.emoji) == emoji_code, message.reactions):
+            if force or len(participants_tally.voters[emoji_code]) != reaction.count - reaction.me:
+                players = await Lottery.get_players(message.guild, reaction)
+                participants_tally.set_voters(emoji_code, [player.id for player in players])
+                logger.debug(f"Reconciled participants of lottery message {message.id}.")
+
+    @tasks.loop(seconds=PARTICIPANTS_FLUSH_FREQUENCY.seconds)
+    async def flush_participants_tallies(self):
+        self.pending_lotteries.flush_tallies()
 
     @commands.group(
         name='lottery',
@@ -57,14 +92,20 @@ class Lottery(_command.Command):
     @lottery.command(
         name='setup',
         aliases=['s', 'set', 'plan'],
-        usage="<\"announce\"> <#dest_channel> <:emoji:> <nb_winners> <\"time\"> [--no-announce]",
+        usage="<\"announce\"> <#dest_channel> <:emoji:> <nb_winners> <\"time\"> [--no-announce] "
+              "[--tiers=\"sizes\"] [--weights=\"Role:weight, ...\"]",
         brief="Programme un tirage au sort",
         help="Le bot publie une **annonce** dans le **canal de destination**. Les joueurs participent en cliquant sur "
              "l'**émoji** de réaction. À la **date et heure** indiquées (au format `\"YYYY-MM-DD HH:MM:SS\"`), un "
              "**nombre de gagnants** sont tirés au sort et contactés par MP par le bot. L'organisateur reçoit par MP "
              "une copie du résultat et de la liste des participants injoignables. Par défaut, l'annonce mentionne "
              "automatiquement le rôle `@Abonné Annonces`. Pour éviter cela, il faut ajouter l'argument "
-             "`--no-announce`.",
+             "`--no-announce`.\n"
+             "Pour répartir les gagnants en plusieurs paliers de lots, il faut ajouter l'argument "
+             "`--tiers=\"1, 3, 5\"` où la somme des paliers vaut le nombre de gagnants. Les premiers tirés "
+             "remportent le premier palier, et ainsi de suite. Pour multiplier les chances des joueurs selon "
+             "leurs rôles, il faut ajouter l'argument `--weights=\"Rôle:poids, ...\"` (poids entiers). Un joueur "
+             "ayant plusieurs de ces rôles bénéficie du poids le plus élevé, les autres ont un poids de 1.",
         ignore_extra=False
     )
     @commands.check(checker.has_any_mod_role)
@@ -82,32 +123,36 @@ class Lottery(_command.Command):
         if not context.author.permissions_in(dest_channel).send_messages:
             raise exceptions.ForbiddenChannel(dest_channel)
 
+        tier_sizes = self.parse_tier_sizes(options, nb_winners)
+        role_weights = self.parse_role_weights(options, context.guild)
+
         # Run command
         organizer = context.author
         do_announce = not utils.is_option_enabled(options, 'no-announce')
         prefixed_announce = utils.make_announce(
             context.guild, announce, do_announce and self.ANNOUNCE_ROLE_NAME
         )
-        embed = self.build_announce_embed(emoji, nb_winners, organizer, time, self.guild.roles)
+        embed = self.build_announce_embed(
+            emoji, nb_winners, organizer, time, self.guild.roles, tier_sizes=tier_sizes, role_weights=role_weights
+        )
         message = await dest_channel.send(prefixed_announce, embed=embed)
-        await message.add_reaction(emoji)
+        await dispatcher.update_reactions(message, add_emojis=[emoji])
 
         # Register data
         job_id = scheduler.schedule_stored_job(
             zbot.db.PENDING_LOTTERIES_COLLECTION, time, self.run_lottery, message.id
         ).id
         lottery_data = {
-            'lottery_id': self.get_next_lottery_id(),
+            'lottery_id': self.pending_lotteries.get_next_public_id(),
             'message_id': message.id,
             'channel_id': dest_channel.id,
             'emoji_code': emoji if isinstance(emoji, str) else emoji.id,
             'nb_winners': nb_winners,
             'organizer_id': organizer.id,
+            'tier_sizes': tier_sizes,
+            'role_weights': role_weights,
         }
-        zbot.db.update_lottery_data(job_id, lottery_data)
-        # Add data managed by scheduler later to avoid updating the database with them
-        lottery_data.update({'_id': job_id, 'next_run_time': converter.to_timestamp(time)})
-        self.pending_lotteries[message.id] = lottery_data
+        self.pending_lotteries.add(job_id, lottery_data, {'next_run_time': converter.to_timestamp(time)})
 
         # Confirm command
         await context.send(
@@ -115,7 +160,43 @@ class Lottery(_command.Command):
         )
 
     @staticmethod
-    def build_announce_embed(emoji, nb_winners, organizer, time, guild_roles):
+    def parse_tier_sizes(options, nb_winners) -> typing.List[int] or None:
+        """Parse the sizes of the prize tiers from the `--tiers` option, whose sum must be the number of winners."""
+        if not (tiers_option := utils.get_option_value(options, 'tiers')):
+            return None
+        tier_sizes = [tier_size.strip() for tier_size in tiers_option.split(',')]
+        if not all(tier_size.isdigit() and int(tier_size) > 0 for tier_size in tier_sizes) \
+                or sum(map(int, tier_sizes)) != nb_winners:
+            raise exceptions.MisformattedArgument(
+                tiers_option, f"liste d'entiers positifs séparés par des virgules et de somme {nb_winners}"
+            )
+        return list(map(int, tier_sizes))
+
+    @staticmethod
+    def parse_role_weights(options, guild) -> typing.List[typing.Tuple[str, int]] or None:
+        """
+        Parse the weights of the roles from the `--weights` option.
+        The weights are kept as a list of pairs as role names can't always be used as keys in MongoDB.
+        """
+        if not (weights_option := utils.get_option_value(options, 'weights')):
+            return None
+        role_weights = []
+        for role_weight in weights_option.split(','):
+            role_name, _, weight = role_weight.strip().rpartition(':')
+            if not role_name or not weight.isdigit() or int(weight) <= 0:
+                raise exceptions.MisformattedArgument(role_weight.strip(), "Rôle:poids (poids entier positif)")
+            utils.try_get(guild.roles, error=exceptions.UnknownRole(role_name), name=role_name)
+            role_weights.append((role_name, int(weight)))
+        return role_weights
+
+    @staticmethod
+    def get_draw_settings(message_id) -> dict:
+        """Return the optional settings of the draw of a pending lottery, as keyword arguments."""
+        lottery_data = Lottery.pending_lotteries[message_id]
+        return {'tier_sizes': lottery_data.get('tier_sizes'), 'role_weights': lottery_data.get('role_weights')}
+
+    @staticmethod
+    def build_announce_embed(emoji, nb_winners, organizer, time, guild_roles, tier_sizes=None, role_weights=None):
         embed = discord.Embed(
             title=f"Tirage au sort le {converter.to_human_format(time)} :alarm_clock:",
             color=Lottery.EMBED_COLOR
@@ -136,39 +217,68 @@ class Lottery(_command.Command):
                 name=Lottery.USER_ROLE_NAMES[0]
             ).mention
         )
+        if tier_sizes:
+            embed.add_field(
+                name="Paliers",
+                value="\n".join(
+                    f"Palier {tier_index} : **{tier_size}** gagnant{('s' if tier_size > 1 else '')}"
+                    for tier_index, tier_size in enumerate(tier_sizes, start=1)
+                )
+            )
+        if role_weights:
+            embed.add_field(
+                name="Chances multipliées",
+                value="\n".join(f"@{role_name} : x{weight}" for role_name, weight in role_weights)
+            )
         embed.set_author(
             name=f"Organisateur : @{organizer.display_name}",
             icon_url=organizer.avatar_url
         )
         return embed
 
-    def get_next_lottery_id(self) -> int:
-        pending_lottery_ids = [lottery_data['lottery_id'] for lottery_data in self.pending_lotteries.values()]
-        return max(pending_lottery_ids) + 1 if pending_lottery_ids else 1
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        message_id = payload.message_id
+        if message_id not in Lottery.pending_lotteries or payload.user_id == zbot.bot.user.id:
+            return
+        emoji_code = utils.get_emoji_code(payload.emoji)
+        if emoji_code != Lottery.pending_lotteries[message_id]['emoji_code']:
+            return
+        user = payload.member
+        if not user or user.bot:
+            return
+        if checker.has_any_role(self.guild, user, Lottery.USER_ROLE_NAMES):
+            Lottery.pending_lotteries.get_tally(message_id).add_vote(emoji_code, user.id)
+        else:
+            try:
+                await utils.try_dm(
+                    user, f"Vous devez avoir le rôle @{Lottery.USER_ROLE_NAMES[0]} pour "
+                          f"participer à cette loterie."
+                )
+                message = self.guild.get_channel(payload.channel_id).get_partial_message(message_id)
+                await message.remove_reaction(payload.emoji, user)
+            except (
+                    discord.errors.HTTPException,
+                    discord.errors.NotFound,
+                    discord.errors.Forbidden
+            ):
+                pass
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if payload.message_id in Lottery.pending_lotteries:
+            Lottery.pending_lotteries.get_tally(payload.message_id).remove_vote(
+                utils.get_emoji_code(payload.emoji), payload.user_id
+            )
 
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
-        message = reaction.message
-        message_id = message.id
-        emoji = reaction.emoji
-        if message_id in Lottery.pending_lotteries:
-            lottery_emoji_code = Lottery.pending_lotteries[message_id]['emoji_code']
-            same_emoji = emoji == lottery_emoji_code if isinstance(emoji, str) else emoji.id == lottery_emoji_code
-            if same_emoji and \
-                    not user.bot and \
-                    not checker.has_any_role(self.guild, user, Lottery.USER_ROLE_NAMES):
-                try:
-                    await utils.try_dm(
-                        user, f"Vous devez avoir le rôle @{Lottery.USER_ROLE_NAMES[0]} pour "
-                              f"participer à cette loterie."
-                    )
-                    await message.remove_reaction(emoji, user)
-                except (
-                        discord.errors.HTTPException,
-                        discord.errors.NotFound,
-                        discord.errors.Forbidden
-                ):
-                    pass
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        """Withdraw the participations of members who lost the required role."""
+        # The member cache already holds the new roles, check those of the previous state directly
+        if any(checker.has_role(before, role_name) for role_name in Lottery.USER_ROLE_NAMES) \
+                and not any(checker.has_role(after, role_name) for role_name in Lottery.USER_ROLE_NAMES):
+            for message_id, lottery_data in Lottery.pending_lotteries.items():
+                Lottery.pending_lotteries.get_tally(message_id).remove_vote(lottery_data['emoji_code'], after.id)
 
     @lottery.command(
         name='list',
@@ -225,12 +335,15 @@ class Lottery(_command.Command):
         message, channel, emoji, nb_winners, _, organizer = await Lottery.get_message_env(
             lottery_id
         )
+        draw_settings = Lottery.get_draw_settings(message_id)
         try:
             players, reaction, winners = await Lottery.draw(
-                message, emoji, nb_winners, seed
+                message, emoji, nb_winners, seed, role_weights=draw_settings['role_weights']
             )
             await reaction.remove(zbot.bot.user)
-            await Lottery.announce_winners(winners, players, message, organizer)
+            await Lottery.announce_winners(
+                winners, players, message, organizer, tier_sizes=draw_settings['tier_sizes']
+            )
             Lottery.remove_pending_lottery(message_id, cancel_job=manual_run)
         except commands.CommandError as error:
             context = commands.Context(
@@ -260,8 +373,8 @@ class Lottery(_command.Command):
             checker.has_any_mod_role(context, print_error=True)
 
         if message:
-            reaction = utils.try_get(message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji)
-            await reaction.remove(zbot.bot.user)
+            utils.try_get(message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji)
+            await dispatcher.update_reactions(message, remove_emojis=[emoji])
             embed = discord.Embed(
                 title=f"Tirage au sort __annulé__ par {context.author.display_name}",
                 color=Lottery.EMBED_COLOR
@@ -343,15 +456,15 @@ class Lottery(_command.Command):
         previous_reaction = utils.try_get(
             message.reactions, error=exceptions.MissingEmoji(previous_emoji), emoji=previous_emoji
         )
-        await previous_reaction.remove(zbot.bot.user)
-        await message.add_reaction(emoji)
-        embed = self.build_announce_embed(emoji, nb_winners, organizer, time, self.guild.roles)
+        await dispatcher.update_reactions(message, add_emojis=[emoji], remove_emojis=[previous_reaction.emoji])
+        embed = self.build_announce_embed(
+            emoji, nb_winners, organizer, time, self.guild.roles, **self.get_draw_settings(message.id)
+        )
         await message.edit(embed=embed)
 
-        job_id = self.pending_lotteries[message.id]['_id']
-        lottery_data = {'emoji_code': emoji if isinstance(emoji, str) else emoji.id}
-        zbot.db.update_lottery_data(job_id, lottery_data)
-        self.pending_lotteries[message.id].update(lottery_data)
+        emoji_code = emoji if isinstance(emoji, str) else emoji.id
+        self.pending_lotteries.update(message.id, {'emoji_code': emoji_code})
+        self.pending_lotteries.get_tally(message.id).set_options([emoji_code])
         await context.send(
             f"Émoji du tirage au sort d'identifiant `{lottery_id}` remplacé par \"{emoji}\" : "
             f"<{message.jump_url}>"
@@ -378,13 +491,12 @@ class Lottery(_command.Command):
         if context.author != previous_organizer:
             checker.has_any_mod_role(context, print_error=True)
 
-        embed = self.build_announce_embed(emoji, nb_winners, organizer, time, self.guild.roles)
+        embed = self.build_announce_embed(
+            emoji, nb_winners, organizer, time, self.guild.roles, **self.get_draw_settings(message.id)
+        )
         await message.edit(embed=embed)
 
-        job_id = self.pending_lotteries[message.id]['_id']
-        lottery_data = {'organizer_id': organizer.id}
-        zbot.db.update_lottery_data(job_id, lottery_data)
-        self.pending_lotteries[message.id].update(lottery_data)
+        self.pending_lotteries.update(message.id, {'organizer_id': organizer.id})
         await context.send(
             f"Organisateur du tirage au sort d'identifiant `{lottery_id}` remplacé par "
             f"`@{organizer.display_name}` : <{message.jump_url}>"
@@ -412,13 +524,14 @@ class Lottery(_command.Command):
         if context.author != organizer:
             checker.has_any_mod_role(context, print_error=True)
 
-        embed = self.build_announce_embed(emoji, nb_winners, organizer, time, self.guild.roles)
+        embed = self.build_announce_embed(
+            emoji, nb_winners, organizer, time, self.guild.roles, **self.get_draw_settings(message.id)
+        )
         await message.edit(embed=embed)
 
         job_id = self.pending_lotteries[message.id]['_id']
         scheduler.reschedule_stored_job(job_id, time)  # Also updates the next_run_time in db
-        lottery_data = {'next_run_time': converter.to_timestamp(time)}
-        self.pending_lotteries[message.id].update(lottery_data)
+        self.pending_lotteries.update(message.id, {'next_run_time': converter.to_timestamp(time)}, persist=False)
         await context.send(
             f"Date et heure du tirage au sort d'identifiant `{lottery_id}` changées pour le "
             f"`{converter.to_human_format(time)}` : <{message.jump_url}>"
@@ -430,7 +543,8 @@ class Lottery(_command.Command):
         usage="<lottery_id> <nb_winners>",
         brief="Modifie le nombre de gagnants du tirage au sort",
         help="Le précédent nombre de gagnants du tirage au sort est remplacé par le nombre de "
-             "gagnants fourni.",
+             "gagnants fourni. Les paliers de lots sont abandonnés si leur somme ne correspond plus au nombre de "
+             "gagnants.",
         ignore_extra=False
     )
     @commands.check(checker.has_any_user_role)
@@ -446,13 +560,15 @@ class Lottery(_command.Command):
         if context.author != organizer:
             checker.has_any_mod_role(context, print_error=True)
 
-        embed = self.build_announce_embed(emoji, nb_winners, organizer, time, self.guild.roles)
+        tier_sizes = self.pending_lotteries[message.id].get('tier_sizes')
+        if tier_sizes and sum(tier_sizes) != nb_winners:
+            tier_sizes = None
+        self.pending_lotteries.update(message.id, {'nb_winners': nb_winners, 'tier_sizes': tier_sizes})
+        embed = self.build_announce_embed(
+            emoji, nb_winners, organizer, time, self.guild.roles, **self.get_draw_settings(message.id)
+        )
         await message.edit(embed=embed)
 
-        job_id = self.pending_lotteries[message.id]['_id']
-        lottery_data = {'nb_winners': nb_winners}
-        zbot.db.update_lottery_data(job_id, lottery_data)
-        self.pending_lotteries[message.id].update(lottery_data)
         await context.send(
             f"Nombre de gagnants du tirage au sort d'identifiant `{lottery_id}` changé à "
             f"`{nb_winners}` : <{message.jump_url}>"
@@ -462,10 +578,7 @@ class Lottery(_command.Command):
     async def get_message_env(lottery_id: int, raise_if_not_found=True) -> (
         discord.Message, discord.TextChannel, typing.Union[str, discord.Emoji], datetime.datetime, str, discord.Member
     ):
-        if not (lottery_data := discord.utils.find(
-                lambda data: data['lottery_id'] == lottery_id,
-                Lottery.pending_lotteries.values()
-        )):
+        if not (lottery_data := Lottery.pending_lotteries.get_by_public_id(lottery_id)):
             raise exceptions.UnknownLottery(lottery_id)
 
         channel = zbot.bot.get_channel(lottery_data['channel_id'])
@@ -485,19 +598,15 @@ class Lottery(_command.Command):
     def remove_pending_lottery(message_id, cancel_job=False):
         if message_id not in Lottery.pending_lotteries:
             return  # Callback of misfired lottery or manual run
-        for lottery_data in Lottery.pending_lotteries.values():
-            if lottery_data['lottery_id'] > Lottery.pending_lotteries[message_id]['lottery_id']:
-                lottery_data['lottery_id'] -= 1
-                zbot.db.update_lottery_data(lottery_data['_id'], {'lottery_id': lottery_data['lottery_id']})
+        lottery_data = Lottery.pending_lotteries.remove(message_id)
         if cancel_job:
-            scheduler.cancel_stored_job(Lottery.pending_lotteries[message_id]['_id'])
-        del Lottery.pending_lotteries[message_id]
+            scheduler.cancel_stored_job(lottery_data['_id'])
 
     @lottery.command(
         name='simulate',
         aliases=['sim'],
         usage="<#src_channel> <message_id> [:emoji:] [nb_winners] [#dest_channel] [@organizer] "
-              "[seed]",
+              "[seed] [--tiers=\"sizes\"] [--weights=\"Role:weight, ...\"]",
         brief="Simule un tirage au sort",
         help="Le bot tire au sort le **nombre de gagnants** parmi les joueurs ayant réagi au "
              "**message source** avec l'émoji de la réaction présente si elle est unique, avec "
@@ -506,7 +615,8 @@ class Lottery(_command.Command):
              "un **organisateur** est indiqué, les gagnants sont contactés par MP et "
              "l'organisateur reçoit par MP une copie du résultat et de la liste des participants "
              "injoignables. Si un **seed** est fourni, la simulation se base dessus pour le choix "
-             "des gagnants.",
+             "des gagnants. Les arguments `--tiers` et `--weights` s'utilisent comme pour la commande "
+             "`+lottery setup`.",
         ignore_extra=False
     )
     @commands.check(checker.has_any_user_role)
@@ -515,14 +625,17 @@ class Lottery(_command.Command):
         self, context: commands.Context,
         src_channel: discord.TextChannel,
         message_id: int,
-        emoji: converter.to_emoji = None,
-        nb_winners: converter.to_positive_int = 1,
-        dest_channel: discord.TextChannel = None,
-        organizer: discord.User = None,
-        seed: int = None
+        emoji: typing.Optional[converter.to_emoji] = None,  # Optional to let the options be passed in any case
+        nb_winners: typing.Optional[converter.to_positive_int] = 1,
+        dest_channel: typing.Optional[discord.TextChannel] = None,
+        organizer: typing.Optional[discord.User] = None,
+        seed: typing.Optional[int] = None,
+        *, options=""
     ):
         if dest_channel and not context.author.permissions_in(dest_channel).send_messages:
             raise exceptions.ForbiddenChannel(dest_channel)
+        tier_sizes = self.parse_tier_sizes(options, nb_winners)
+        role_weights = self.parse_role_weights(options, context.guild)
 
         message = await utils.try_get_message(
             src_channel, message_id, error=exceptions.MissingMessage(message_id)
@@ -535,47 +648,78 @@ class Lottery(_command.Command):
             else:
                 emoji = message.reactions[0].emoji
         players, reaction, winners = await Lottery.draw(
-            message, emoji, nb_winners, seed=seed
+            message, emoji, nb_winners, seed=seed, role_weights=role_weights
         )
         announce = f"Tirage au sort sur base de la réaction {emoji}" \
                    f"{f' et du seed `{seed}`' if seed else ''} au message {message.jump_url}"
         announcement = await (dest_channel or context).send(announce)
         await Lottery.announce_winners(
-            winners, players, announcement, organizer=organizer
+            winners, players, announcement, organizer=organizer, tier_sizes=tier_sizes
         )
 
     @staticmethod
-    async def draw(message, emoji, nb_winners, seed=None):
-        await Lottery.prepare_seed(seed)
+    async def draw(message, emoji, nb_winners, seed=None, role_weights=None):
         reaction = utils.try_get(message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji)
-        players, winners = await Lottery.pick_winners(message.guild, reaction, nb_winners)
+        if message.id in Lottery.pending_lotteries:  # Draw from the participants tracked since the setup
+            await Lottery.reconcile_participants_tally(message)
+            players = Lottery.get_participants(message.guild, message.id)
+        else:  # Simulation on an arbitrary message
+            players = await Lottery.get_players(message.guild, reaction)
+        random_draw = draw_engine.Draw(seed)
+        logger.debug(f"Picking winners using seed = {random_draw.seed} ({utils.utc_now()})")
+        winners = Lottery.pick_winners(players, nb_winners, random_draw, role_weights=role_weights)
+        zbot.db.insert_draw_log(
+            utils.utc_now(), random_draw.seed, message.id, len(players), (winner.id for winner in winners)
+        )
         return players, reaction, winners
 
     @staticmethod
-    async def prepare_seed(default_seed=None):
-        seed = default_seed if default_seed else random.randrange(10 ** 6)  # 6 digits seed
-        random.seed(seed)
-        logger.debug(f"Picking winners using seed = {seed} ({utils.utc_now()})")
+    def get_participants(guild, message_id) -> typing.List[discord.Member]:
+        """Return the tracked participants still members with a required role, ordered by id as the reactions are."""
+        emoji_code = Lottery.pending_lotteries[message_id]['emoji_code']
+        participant_ids = sorted(Lottery.pending_lotteries.get_tally(message_id).voters[emoji_code])
+        return [
+            member for participant_id in participant_ids if (member := guild.get_member(participant_id))
+            and checker.has_any_role(guild, member, Lottery.USER_ROLE_NAMES)  # In case a role update was missed
+        ]
 
     @staticmethod
-    async def pick_winners(guild, reaction, nb_winners, ignore_roles=False):
-        players = list(filter(
+    async def get_players(guild, reaction, ignore_roles=False):
+        return list(filter(
             lambda m: checker.has_any_role(guild, m, Lottery.USER_ROLE_NAMES)
             or ignore_roles and not m.bot,
             await reaction.users().flatten())
         )
-        nb_winners = min(nb_winners, len(players))
-        winners = random.sample(players, nb_winners)
-        return players, winners
+
+    @staticmethod
+    def pick_winners(players, nb_winners, random_draw: draw_engine.Draw, role_weights=None):
+        """Draw the winners without replacement, in order of draw so that they can be split into prize tiers."""
+        if role_weights:
+            weights = [Lottery.get_player_weight(player, role_weights) for player in players]
+            return random_draw.weighted_sample(players, weights, nb_winners)
+        return random_draw.sample(players, nb_winners)
+
+    @staticmethod
+    def get_player_weight(player, role_weights) -> int:
+        """Return the highest weight among the roles of the player, or 1 if none of them is weighted."""
+        player_role_names = {role.name for role in getattr(player, 'roles', [])}  # Users who left have no roles
+        return max((weight for role_name, weight in role_weights if role_name in player_role_names), default=1)
 
     @staticmethod
     async def announce_winners(
-        winners: [discord.User], players: [discord.User], message, organizer: discord.User = None
+        winners: [discord.User], players: [discord.User], message, organizer: discord.User = None,
+        tier_sizes: typing.List[int] = None
     ):
+        if tier_sizes:
+            winner_description = "\n".join(
+                f"**Palier {tier_index}** : {utils.make_user_list(tier_winners) or 'Aucun'}"
+                for tier_index, tier_winners in enumerate(draw_engine.split_tiers(winners, tier_sizes), start=1)
+            )
+        else:
+            winner_description = utils.make_user_list(winners, "\n")
         embed = discord.Embed(
             title="Résultats du tirage au sort 🎉",
-            description=f"Gagnant(s) parmi {len(players)} participant(s):\n" +
-                        utils.make_user_list(winners, "\n"),
+            description=f"Gagnant(s) parmi {len(players)} participant(s):\n" + winner_description,
             color=Lottery.EMBED_COLOR
         )
         if organizer:
@@ -584,21 +728,22 @@ class Lottery(_command.Command):
         await message.edit(embed=embed)
 
         if organizer:
-            # DM winners
-            unreachable_winners = []
-            for winner in winners:
-                if not await utils.try_dm(
-                    winner, f"Félicitations ! Tu as été tiré au sort lors de la loterie organisée "
-                            f"par {organizer.display_name} ({organizer.mention}) !\n"
-                            f"Contacte cette personne par MP pour obtenir ta récompense :wink:" +
-                            f"\nLien : {message.jump_url}"
-                ):
-                    unreachable_winners.append(winner)
-            # DM organizer
+            # DM winners and organizer
+            messages_by_recipient = {
+                winner: [
+                    f"Félicitations ! Tu as été tiré au sort lors de la loterie organisée "
+                    f"par {organizer.display_name} ({organizer.mention}) !\n"
+                    f"Contacte cette personne par MP pour obtenir ta récompense :wink:" +
+                    f"\nLien : {message.jump_url}"
+                ] for winner in winners
+            }
             winner_list = utils.make_user_list(winners)
-            await utils.try_dm(organizer, f"Les gagnants de la loterie sont: {winner_list}\n"
-                                          f"Lien : {message.jump_url}")
-            if unreachable_winners:
+            messages_by_recipient.setdefault(organizer, []).append(
+                f"Les gagnants de la loterie sont: {winner_list}\n"
+                f"Lien : {message.jump_url}"
+            )
+            report = await dispatcher.send_dms(messages_by_recipient)
+            if unreachable_winners := [winner for winner in winners if winner not in report.sent]:
                 unreachable_winner_list = utils.make_user_list(unreachable_winners)
                 await utils.try_dm(organizer, f"Les gagnants suivants ont bloqué les MPs et n'ont "
                                               f"pas pu être contactés: {unreachable_winner_list}")
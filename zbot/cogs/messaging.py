@@ -1,13 +1,16 @@
-import asyncio
 import datetime
-import random
+import functools
+import itertools
 
 import discord
 from discord.ext import commands
 from discord.ext import tasks
 
+from zbot import activity
+from zbot import catalogue
 from zbot import checker
 from zbot import converter
+from zbot import dispatcher
 from zbot import exceptions
 from zbot import logger
 from zbot import scheduler
@@ -34,9 +37,25 @@ class Messaging(_command.Command):
     CELEBRATION_EMOJI = "🕯"
     AUTOMESSAGE_FREQUENCY = datetime.timedelta(hours=4)  # The time to wait after that the last message was posted
     AUTOMESSAGE_WAIT = datetime.timedelta(minutes=5)  # The time to wait for a channel to be quiet
+    AUTOMESSAGE_MAX_ATTEMPTS = 3  # The number of quietness checks before skipping an automessage
+    BULK_DELETION_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)  # With a margin for latency
+    BULK_DELETION_MAX_COUNT = 100  # The maximum number of messages deleted by a single request
+    RELOCATION_WEBHOOK_NAME = 'ZBot switch'
+
+    # Last message of each channel, for quietness checks without fetching the history
+    channel_activity = activity.ChannelActivityTracker()
+    # Local cache of the automessages, loaded once
+    automessages = catalogue.AutomessageCatalogue(zbot.db)
+    # Ids of the members whose name carries the celebration emoji, kept up to date by the member events
+    celebrated_member_ids = set()
 
     def __init__(self, bot):
         super().__init__(bot)
+        # Use class attribute to be available from static methods
+        Messaging.automessages.load()
+        Messaging.celebrated_member_ids.update(
+            member.id for member in self.guild.members if self.CELEBRATION_EMOJI in member.display_name
+        )
         bot.loop.create_task(self.schedule_anniversaries_celebration())
         self.send_automessage.start()
 
@@ -73,35 +92,32 @@ class Messaging(_command.Command):
                 if member and checker.has_role(member, Messaging.PLAYER_ROLE_NAME):
                     member_anniversaries.setdefault(years, []).append(member)
 
-        # Remove celebration emojis in names from previous anniversaries
-        for member in self.guild.members:
-            if self.CELEBRATION_EMOJI in member.display_name:
-                try:
-                    await member.edit(
-                        nick=member.display_name.replace(self.CELEBRATION_EMOJI, '').rstrip()
-                    )
-                except (discord.Forbidden, discord.HTTPException):
-                    pass
-
-        # Add celebration emojis for today's anniversaries
+        # Remove celebration emojis in names from previous anniversaries and add those of today's anniversaries
+        nicks = {}  # {member: nick}
+        for member_id in self.celebrated_member_ids:
+            if member := self.guild.get_member(member_id):
+                nicks[member] = member.display_name.replace(self.CELEBRATION_EMOJI, '').rstrip()
         for year, members in member_anniversaries.items():
             for member in members:
-                try:
-                    await member.edit(
-                        nick=member.display_name + " " + self.CELEBRATION_EMOJI * year
-                    )
-                except (discord.Forbidden, discord.HTTPException):
-                    pass
+                nicks[member] = nicks.get(member, member.display_name) + " " + self.CELEBRATION_EMOJI * year
+        results_by_member = await dispatcher.dispatch({
+            member: [functools.partial(member.edit, nick=nick)]
+            for member, nick in nicks.items() if nick != member.display_name
+        })  # Failures (missing permissions on higher roles, ...) are ignored
+        edited_count = sum(not isinstance(results[0], Exception) for results in results_by_member.values())
+        logger.debug(f"Edited nicknames of {edited_count}/{len(results_by_member)} member(s) for anniversaries.")
 
         # Announce anniversaries (after updating names to refresh the cache)
         celebration_channel = self.guild.get_channel(self.CELEBRATION_CHANNEL_ID)
         if member_anniversaries:
-            await celebration_channel.send("**Voici les anniversaires du jour !** 🎂")
-            for year in sorted(member_anniversaries.keys(), reverse=True):
-                for member in member_anniversaries[year]:
-                    await celebration_channel.send(
-                        f"  • {member.mention} fête ses **{year}** ans sur World of Tanks ! 🥳"
-                    )
+            for block in utils.make_message_blocks([
+                "**Voici les anniversaires du jour !** 🎂", *[
+                    f"  • {member.mention} fête ses **{year}** ans sur World of Tanks ! 🥳"
+                    for year in sorted(member_anniversaries.keys(), reverse=True)
+                    for member in member_anniversaries[year]
+                ]
+            ]):
+                await celebration_channel.send(block)
 
         zbot.db.update_metadata('last_anniversaries_celebration', today)
 
@@ -139,58 +155,73 @@ class Messaging(_command.Command):
     async def send_automessage(self):
         # Check if not running above frequency
         now = utils.bot_tz_now()
-        last_automessage_date = zbot.db.get_metadata('last_automessage_date')
+        last_automessage_date = self.automessages.last_automessage_date
         if last_automessage_date:
             last_automessage_date_localized = converter.to_utc(last_automessage_date)
             if not utils.is_time_almost_elapsed(last_automessage_date_localized, now, self.AUTOMESSAGE_FREQUENCY):
                 logger.debug(f"Prevented sending automessage because running above defined frequency.")
                 return
 
-        # Get automessages data
-        automessages_data = zbot.db.load_automessages(
-            {'automessage_id': {
-                '$ne': zbot.db.get_metadata('last_automessage_id')  # Don't post the same message twice in a row
-            }},
-            ['automessage_id', 'channel_id', 'message']
-        )
-        if not automessages_data:  # At most a single automessage exists
-            automessages_data = zbot.db.load_automessages(  # Load it anyway
-                {}, ['automessage_id', 'channel_id', 'message']
-            )
-        if not automessages_data:  # Not automessage exists
-            return  # Abort
-        automessage_data = random.choice(automessages_data)
+        if automessage_data := self.automessages.pick():
+            await self.try_send_automessage(automessage_data)
+
+    async def try_send_automessage(self, automessage_data, attempt_count=1):
+        """Send the automessage once its channel is quiet, or reschedule it for the time the channel gets quiet."""
         automessage_id = automessage_data['automessage_id']
-        message = automessage_data['message']
         channel = self.guild.get_channel(automessage_data['channel_id'])
-        last_channel_message = (await channel.history(limit=1).flatten())[0]
 
         # Run halt checks on target channel
-        if last_channel_message.author == self.user:  # Avoid spamming an channel
+        last_activity = await self.channel_activity.get_last_activity(channel)
+        if last_activity and last_activity.author_id == self.user.id:  # Avoid spamming an channel
             logger.debug(f"Skipped automessage of id {automessage_id} because it is already the last message.")
             return
-        else:  # Avoid interrupting conversations
-            is_channel_quiet, attempt_count = False, 0
-            while not is_channel_quiet:  # Wait for the channel to be quiet to send the message
-                now = utils.bot_tz_now()
-                last_channel_message_date_localized = converter.to_utc(last_channel_message.created_at)
-                is_channel_quiet = last_channel_message_date_localized < now - self.AUTOMESSAGE_WAIT
-                if not is_channel_quiet:
-                    attempt_count += 1
-                    if attempt_count < 3:
-                        logger.debug(
-                            f"Pausing automessage of id {automessage_id} for {self.AUTOMESSAGE_WAIT.seconds} "
-                            f"seconds while waiting for quietness in target channel."
-                        )
-                        await asyncio.sleep(self.AUTOMESSAGE_WAIT.seconds)  # Sleep for the duration of the delay
-                    else:  # After 3 failed attempts, skip
-                        logger.debug(f"Skipped automessage of id {automessage_id} after 3 waits for quietness.")
-                        return
+        now = utils.bot_tz_now()
+        quiet_time = await self.channel_activity.get_quiet_time(channel, self.AUTOMESSAGE_WAIT)
+        if quiet_time > now:  # Avoid interrupting conversations
+            if attempt_count < self.AUTOMESSAGE_MAX_ATTEMPTS:
+                logger.debug(
+                    f"Postponing automessage of id {automessage_id} to {quiet_time} while waiting for quietness in "
+                    f"target channel."
+                )
+                scheduler.schedule_volatile_job(
+                    quiet_time, self.try_send_automessage, automessage_data, attempt_count + 1
+                )
+            else:
+                logger.debug(
+                    f"Skipped automessage of id {automessage_id} after {attempt_count} waits for quietness."
+                )
+            return
 
         # All checks passed, send the automessage
-        zbot.db.update_metadata('last_automessage_id', automessage_id)
-        zbot.db.update_metadata('last_automessage_date', now)
-        await channel.send(message)
+        self.automessages.record_post(automessage_id, now)
+        await channel.send(automessage_data['message'])
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild == self.guild:
+            self.channel_activity.record(message)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.index_celebrated_member(member)  # Rejoining members can keep their nick, and its celebration emojis
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.index_celebrated_member(after)
+
+    def index_celebrated_member(self, member: discord.Member):
+        if self.CELEBRATION_EMOJI in member.display_name:
+            self.celebrated_member_ids.add(member.id)
+        else:
+            self.celebrated_member_ids.discard(member.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.celebrated_member_ids.discard(member.id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.channel_activity.forget(payload.channel_id, payload.message_id)
 
     @commands.group(
         name='automessage',
@@ -210,32 +241,28 @@ class Messaging(_command.Command):
     @automessage.command(
         name='add',
         aliases=['new'],
-        usage="<#channel> <\"message\">",
+        usage="<#channel> <\"message\"> [weight]",
         brief="Ajoute un nouveau message automatique",
         help="Le bot tire au sort à intervalles réguliers un message automatique parmi ceux existants et le poste dans "
-             "le canal associé.",
+             "le canal associé. Les chances d'être tiré au sort sont proportionnelles au **poids** du message, qui "
+             "vaut 1 par défaut.",
         hidden=True,
         ignore_extra=False
     )
     @commands.check(checker.has_any_mod_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
-    async def automessage_add(self, context, channel: discord.TextChannel, message: str):
+    async def automessage_add(
+        self, context, channel: discord.TextChannel, message: str,
+        weight: converter.to_positive_int = catalogue.DEFAULT_WEIGHT
+    ):
         if not context.author.permissions_in(channel).send_messages:
             raise exceptions.ForbiddenChannel(channel)
 
-        automessage_id = self.get_next_automessage_id()
-        zbot.db.insert_automessage(automessage_id, message, channel)
+        automessage_id = self.automessages.add(message, channel.id, weight)
         await context.send(
             f"Message automatique d'identifiant `{automessage_id}` créé et lié au canal {channel.mention}."
         )
 
-    @staticmethod
-    def get_next_automessage_id() -> int:
-        automessage_ids = [
-            automessage_data['automessage_id'] for automessage_data in zbot.db.load_automessages({}, ['automessage_id'])
-        ]
-        return max(automessage_ids) + 1 if automessage_ids else 1
-
     @automessage.command(
         name='list',
         aliases=['l', 'ls'],
@@ -247,13 +274,15 @@ class Messaging(_command.Command):
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def automessage_list(self, context):
         automessage_descriptions = {}
-        for automessage_data in zbot.db.load_automessages({}, ['automessage_id', 'message', 'channel_id']):
+        for automessage_data in self.automessages.values():
             automessage_id = automessage_data['automessage_id']
             message = automessage_data['message']
             if len(message) > 120:  # Avoid reaching the 2000 chars limit per message
                 message = message[:120] + "..."
             channel = self.guild.get_channel(automessage_data['channel_id'])
-            automessage_descriptions[automessage_id] = f" • `[{automessage_id}]` dans {channel.mention}: \"{message}\""
+            weight = automessage_data.get('weight', catalogue.DEFAULT_WEIGHT)
+            automessage_descriptions[automessage_id] = f" • `[{automessage_id}]` dans {channel.mention} " \
+                                                       f"(poids {weight}): \"{message}\""
         embed_description = "Aucun" if not automessage_descriptions \
             else "\n".join([automessage_descriptions[automessage_id]
                             for automessage_id in sorted(automessage_descriptions.keys())])
@@ -277,12 +306,11 @@ class Messaging(_command.Command):
     @commands.check(checker.has_any_mod_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def automessage_print(self, context, automessage_id: int, *, options=""):
-        automessages_data = zbot.db.load_automessages({'automessage_id': automessage_id}, ['message'])
-        if not automessages_data:
+        if not (automessage_data := self.automessages.get(automessage_id)):
             raise exceptions.UnknownAutomessage(automessage_id)
 
         raw_text = utils.is_option_enabled(options, 'raw')
-        message = automessages_data[0]['message']
+        message = automessage_data['message']
         await context.send(message if not raw_text else f"`{message}`")
 
     @automessage.command(
@@ -296,20 +324,10 @@ class Messaging(_command.Command):
     @commands.check(checker.has_any_mod_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def automessage_remove(self, context, automessage_id: int):
-        automessages_data = zbot.db.load_automessages({}, ['_id', 'automessage_id'])
-        automessage_data = [data for data in automessages_data if data['automessage_id'] == automessage_id]
-        if not automessage_data:
+        if automessage_id not in self.automessages:
             raise exceptions.UnknownAutomessage(automessage_id)
 
-        document_id = automessage_data[0]['_id']  # Backup before overwrite
-        automessages_update_data = {}
-        for automessage_data in automessages_data:
-            if automessage_data['automessage_id'] > automessage_id:
-                automessages_update_data[automessage_data['_id']] = {
-                    'automessage_id': automessage_data['automessage_id'] - 1
-                }
-        zbot.db.update_automessages(automessages_update_data)
-        zbot.db.delete_automessage(document_id)
+        self.automessages.remove(automessage_id)
         await context.send(f"Message automatique d'identifiant `{automessage_id}` supprimé.")
 
     @automessage.group(
@@ -338,14 +356,12 @@ class Messaging(_command.Command):
     @commands.check(checker.has_any_mod_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def automessage_edit_channel(self, context, automessage_id: int, channel: discord.TextChannel):
-        automessages_data = zbot.db.load_automessages({'automessage_id': automessage_id}, ['_id'])
-        if not automessages_data:
+        if automessage_id not in self.automessages:
             raise exceptions.UnknownAutomessage(automessage_id)
         if not context.author.permissions_in(channel).send_messages:
             raise exceptions.ForbiddenChannel(channel)
 
-        document_id = automessages_data[0]['_id']
-        zbot.db.update_automessages({document_id: {'channel_id': channel.id}})
+        self.automessages.update(automessage_id, {'channel_id': channel.id})
         await context.send(f"Message automatique d'identifiant {automessage_id} lié au canal {channel.mention}.")
 
     @automessage_edit.command(
@@ -360,23 +376,40 @@ class Messaging(_command.Command):
     @commands.check(checker.has_any_mod_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def automessage_edit_message(self, context, automessage_id: int, message: str):
-        automessages_data = zbot.db.load_automessages({'automessage_id': automessage_id}, ['_id'])
-        if not automessages_data:
+        if automessage_id not in self.automessages:
             raise exceptions.UnknownAutomessage(automessage_id)
 
-        document_id = automessages_data[0]['_id']
-        zbot.db.update_automessages({document_id: {'message': message}})
+        self.automessages.update(automessage_id, {'message': message})
         await context.send(f"Contenu du message automatique d'identifiant {automessage_id} changé en : `{message}`.")
 
+    @automessage_edit.command(
+        name='weight',
+        aliases=['poids', 'w'],
+        usage="<automessage_id> <weight>",
+        brief="Modifie le poids du message automatique",
+        help="Les chances que cette entrée soit tirée au sort sont proportionnelles au poids fourni.",
+        hidden=True,
+        ignore_extra=False
+    )
+    @commands.check(checker.has_any_mod_role)
+    @commands.check(checker.is_allowed_in_current_guild_channel)
+    async def automessage_edit_weight(self, context, automessage_id: int, weight: converter.to_positive_int):
+        if automessage_id not in self.automessages:
+            raise exceptions.UnknownAutomessage(automessage_id)
+
+        self.automessages.update(automessage_id, {'weight': weight})
+        await context.send(f"Poids du message automatique d'identifiant {automessage_id} changé à `{weight}`.")
+
     @commands.command(
         name='switch',
-        usage='<#dest_channel> [--number=N] [--ping] [--delete]',
+        usage='<#dest_channel> [--number=N] [--ping] [--delete] [--webhook]',
         brief="Redirige une conversation",
         help="Suggère au participants d'une conversation dans le canal courant à la poursuivre ailleurs. Par défaut, "
              "les 3 derniers messages sont copiés dans le canal de destination. Pour modifier le nombre de messages à "
              "copier, ajoutez l'argument `--number=N` où `N` est le nombre de messages à copier (maximum 10). Pour "
              "respectivement mentionner les auteurs de ces messages ou les supprimer, ajoutez l'argument `--ping` ou "
-             "`--delete` (droits de modération requis).",
+             "`--delete` (droits de modération requis). Pour que les messages copiés portent le nom et l'avatar de "
+             "leurs auteurs, ajoutez l'argument `--webhook` (droits de modération requis).",
         ignore_extra=True
     )
     @commands.check(checker.has_any_user_role)
@@ -400,7 +433,8 @@ class Messaging(_command.Command):
             messages_number = 3
         do_ping = utils.is_option_enabled(options, 'ping')
         do_delete = utils.is_option_enabled(options, 'delete')
-        if do_ping or do_delete:
+        use_webhook = utils.is_option_enabled(options, 'webhook')
+        if do_ping or do_delete or use_webhook:
             checker.has_any_mod_role(context, print_error=True)
 
         messages = await context.channel.history(limit=messages_number+1).flatten()
@@ -420,26 +454,63 @@ class Messaging(_command.Command):
             )
         if messages_number != 0:
             await dest_channel.send(f"**Suite de la discussion de {context.channel.mention}** 💨")
-        await self.move_messages(messages, dest_channel, do_ping, do_delete)
+        await self.move_messages(messages, dest_channel, do_ping, do_delete, use_webhook)
 
     @staticmethod
-    async def move_messages(messages, dest_channel, do_ping, do_delete):
+    async def move_messages(messages, dest_channel, do_ping, do_delete, use_webhook=False):
+        """Copy the messages in the destination channel, then delete them from their channel if requested."""
+        webhook = use_webhook and await Messaging.get_relocation_webhook(dest_channel)
+
+        # Post consecutive messages of a same author together, in as few blocks as possible
+        posts = []  # [(author, text)], computed before anything is deleted
+        for author, author_messages in itertools.groupby(messages, key=lambda m: m.author):
+            author_mention = author.mention if do_ping else '@' + author.display_name
+            header = (f"{author_mention}\n" if do_ping else "") if webhook else f"{author_mention} :\n>>> "
+            max_length = utils.MAX_MESSAGE_LENGTH - len(header)
+            contents = [  # Split the messages too long to fit in a block with the header
+                chunk for message in author_messages for chunk in utils.split_message(message.content, max_length - 1)
+            ]
+            for block in utils.make_message_blocks(contents, max_length=max_length):
+                if block.strip():  # Skip messages without text content, such as attachments
+                    posts.append((author, header + block))
+
+        for author, text in posts:
+            if webhook:  # Impersonate the author
+                await webhook.send(text, username=author.display_name, avatar_url=author.avatar_url)
+            else:
+                await dest_channel.send(text)
+        if do_delete:  # Only once all copies are posted, so that a failed copy doesn't lose the messages
+            await Messaging.delete_messages(messages)
 
-        async def _flush_buffer():
-            if content_buffer:
-                author_mention = current_author.mention if do_ping else '@' + current_author.display_name
-                await dest_channel.send(f"{author_mention} :\n>>> " + "\n".join(content_buffer))
-                content_buffer.clear()
+    @staticmethod
+    async def get_relocation_webhook(channel: discord.TextChannel) -> discord.Webhook:
+        webhooks = await channel.webhooks()
+        if webhook := discord.utils.get(webhooks, name=Messaging.RELOCATION_WEBHOOK_NAME):
+            return webhook
+        return await channel.create_webhook(name=Messaging.RELOCATION_WEBHOOK_NAME)
 
-        content_buffer, current_author = [], None
+    @staticmethod
+    async def delete_messages(messages: [discord.Message]):
+        """Delete messages of a same channel in bulk, and those too old to be deleted in bulk one by one."""
+        if not messages:
+            return
+        channel, bulk_deletion_limit_date = messages[0].channel, utils.utc_now() - Messaging.BULK_DELETION_MAX_AGE
+        recent_messages, old_messages = [], []
         for message in messages:
-            if message.author != current_author and current_author is not None:  # New message batch
-                await _flush_buffer()
-            current_author = message.author
-            content_buffer.append(message.content)
-            if do_delete:
-                await message.delete()
-        await _flush_buffer()
+            is_recent = converter.to_utc(message.created_at) > bulk_deletion_limit_date
+            (recent_messages if is_recent else old_messages).append(message)
+        for index in range(0, len(recent_messages), Messaging.BULK_DELETION_MAX_COUNT):
+            await channel.delete_messages(recent_messages[index:index + Messaging.BULK_DELETION_MAX_COUNT])
+        results_by_message_id = await dispatcher.dispatch({message.id: [message.delete] for message in old_messages})
+        if failed_deletions := {
+            message_id: results[0] for message_id, results in results_by_message_id.items()
+            if isinstance(results[0], discord.HTTPException)
+        }:
+            logger.warning(
+                f"Could not delete {len(failed_deletions)} message(s) of channel {channel.id}: "
+                + ", ".join(str(message_id) for message_id in failed_deletions)
+            )
+            raise next(iter(failed_deletions.values()))
 
 
 def setup(bot):
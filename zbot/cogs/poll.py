@@ -3,13 +3,18 @@ import typing
 
 import discord
 from discord.ext import commands
+from discord.ext import tasks
 
 from zbot import checker
 from zbot import converter
+from zbot import debouncer
+from zbot import dispatcher
 from zbot import error_handler
 from zbot import exceptions
 from zbot import logger
+from zbot import registry
 from zbot import scheduler
+from zbot import tally
 from zbot import utils
 from zbot import zbot
 from . import _command
@@ -27,18 +32,57 @@ class Poll(_command.Command):
 
     ANNOUNCE_ROLE_NAME = 'Abonné Annonces'
     EMBED_COLOR = 0x9D71DC  # Pastel purple
+    VOTE_TALLY_FLUSH_FREQUENCY = datetime.timedelta(minutes=5)  # How often the vote tallies are persisted
+    LIVE_RESULTS_EDIT_INTERVAL = datetime.timedelta(seconds=5)  # Minimum delay between two edits of live results
 
-    pending_polls = {}  # Local cache of poll data for reactions check
+    # Local cache of poll data for reactions check
+    pending_polls = registry.PendingJobRegistry(
+        'poll_id', zbot.db.update_poll_data, get_option_codes=lambda poll_data: poll_data['emoji_codes']
+    )
+    # Coalesced edits of the announces of live polls, by message id
+    live_results_debouncer = debouncer.Debouncer(
+        LIVE_RESULTS_EDIT_INTERVAL, lambda message_id: Poll.refresh_live_results(message_id)
+    )
 
     def __init__(self, bot):
         super().__init__(bot)
         # Use class attribute to be available from static methods
-        Poll.pending_polls = zbot.db.load_pending_polls_data(
+        Poll.pending_polls.load(zbot.db.load_pending_polls_data(
             (
                 '_id', 'poll_id', 'message_id', 'channel_id', 'emoji_codes', 'next_run_time', 'organizer_id',
-                'is_exclusive', 'required_role_name'
+                'is_exclusive', 'required_role_name', 'is_live', 'description', registry.PendingJobRegistry.TALLY_KEY
             )
-        )
+        ))
+        bot.loop.create_task(self.reconcile_vote_tallies())
+        self.flush_vote_tallies.start()
+
+    async def reconcile_vote_tallies(self):
+        """Catch up with the votes cast while the bot was offline."""
+        for message_id, poll_data in list(self.pending_polls.items()):
+            channel = self.guild.get_channel(poll_data['channel_id'])
+            if message := await utils.try_get_message(channel, message_id):
+                # Votes both added and removed offline can leave the counts unchanged, refetch all the options
+                await self.reconcile_vote_tally(message, force=True)
+
+    @staticmethod
+    async def reconcile_vote_tally(message: discord.Message, force=False):
+        """
+        Refetch the voters of the options whose reaction count doesn't match the tally.
+        :param force: Whether to refetch the voters of all the options, regardless of their reaction count
+        """
+        vote_tally = Poll.pending_polls.get_tally(message.id)
+        for reaction in message.reactions:
+            emoji_code = utils.get_emoji_code(reaction.emoji)
+            if emoji_code in vote_tally.voters \
+                    and (force or len(vote_tally.voters[emoji_code]) != reaction.count - reaction.me):
+                vote_tally.set_voters(
+                    emoji_code, [user.id for user in await reaction.users().flatten() if user.id != zbot.bot.user.id]
+                )
+                logger.debug(f"Reconciled vote tally of poll message {message.id} for option {reaction.emoji}.")
+
+    @tasks.loop(seconds=VOTE_TALLY_FLUSH_FREQUENCY.seconds)
+    async def flush_vote_tallies(self):
+        self.pending_polls.flush_tallies()
 
     @commands.group(
         name='poll',
@@ -57,7 +101,7 @@ class Poll(_command.Command):
         name='start',
         aliases=['s'],
         usage="<\"announce\"> <\"description\"> <#dest_channel> <\":emoji1: :emoji2: ...\"> "
-              "<\"time\"> [--exclusive] [--role=\"name\"] [--do-announce] [--pin]",
+              "<\"time\"> [--exclusive] [--role=\"name\"] [--live] [--do-announce] [--pin]",
         brief="Démarre un sondage",
         help="Le bot publie un sondage sous forme d'un message correspondant à l'**annonce** et "
              "d'un embed contenant la **description** dans le **canal de destination**. Les "
@@ -66,6 +110,7 @@ class Poll(_command.Command):
              "les résultats sont affichés dans un second message. Par défaut, le sondage est à "
              "choix multiple et il n'y a aucune restriction de rôle. Pour changer cela, il faut "
              "respectivement ajouter les arguments `--exclusive` et `--role=\"Nom de rôle\"`. Pour "
+             "afficher les résultats en direct dans l'embed, ajoutez l'argument `--live`. Pour "
              "automatiquement mentionner le rôle `@Abonné Annonces`, ajoutez l'argument "
              "`--do-announce`. Pour épingler automatiquement l'annonce, ajoutez l'argument "
              "`--pin` (droits de modération requis pour ces deux derniers arguments).",
@@ -102,39 +147,38 @@ class Poll(_command.Command):
 
         # Run command
         is_exclusive = utils.is_option_enabled(options, 'exclusive')
+        is_live = utils.is_option_enabled(options, 'live')
         organizer = context.author
         prefixed_announce = utils.make_announce(
             context.guild, announce, do_announce and self.ANNOUNCE_ROLE_NAME)
         embed = self.build_announce_embed(
-            description, is_exclusive, required_role_name, organizer, time, self.guild.roles)
+            description, is_exclusive, required_role_name, organizer, time, self.guild.roles,
+            results={emoji: 0 for emoji in emoji_list} if is_live else None
+        )
         message = await dest_channel.send(prefixed_announce, embed=embed)
-        for emoji in emoji_list:
-            await message.add_reaction(emoji)
-        if do_pin:
-            await message.pin()
+        await dispatcher.update_reactions(message, add_emojis=emoji_list, pin=do_pin or None)
 
         # Register data
         job_id = scheduler.schedule_stored_job(zbot.db.PENDING_POLLS_COLLECTION, time, self.close_poll, message.id).id
         poll_data = {
-            'poll_id': self.get_next_poll_id(),
+            'poll_id': self.pending_polls.get_next_public_id(),
             'message_id': message.id,
             'channel_id': dest_channel.id,
             'emoji_codes': list(map(lambda e: e if isinstance(e, str) else e.id, emoji_list)),
             'organizer_id': organizer.id,
             'is_exclusive': is_exclusive,
             'required_role_name': required_role_name,
+            'is_live': is_live,
+            'description': description,
         }
-        zbot.db.update_poll_data(job_id, poll_data)
-        # Add data managed by scheduler later to avoid updating the database with them
-        poll_data.update({'_id': job_id, 'next_run_time': converter.to_timestamp(time)})
-        self.pending_polls[message.id] = poll_data
+        self.pending_polls.add(job_id, poll_data, {'next_run_time': converter.to_timestamp(time)})
 
         # Confirm command
         await context.send(f"Sondage d'identifiant `{poll_data['poll_id']}` programmé : <{message.jump_url}>.")
 
     @staticmethod
     def build_announce_embed(
-            description, is_exclusive, required_role_name, organizer, time, guild_roles
+            description, is_exclusive, required_role_name, organizer, time, guild_roles, results=None
     ):
         embed = discord.Embed(
             title=f"Clôture du sondage le {converter.to_human_format(time)} :alarm_clock:",
@@ -158,64 +202,113 @@ class Poll(_command.Command):
                 name=required_role_name
             ).mention if required_role_name else "Aucun"
         )
+        if results is not None:
+            embed.add_field(
+                name="Résultats en direct",
+                value="\n".join(f"{emoji} : **{vote_count}**" for emoji, vote_count in results.items()) or "Aucun",
+                inline=False
+            )
         embed.set_author(
             name=f"Organisateur : @{organizer.display_name}",
             icon_url=organizer.avatar_url
         )
         return embed
 
-    def get_next_poll_id(self) -> int:
-        pending_poll_ids = [poll_data['poll_id'] for poll_data in self.pending_polls.values()]
-        return max(pending_poll_ids) + 1 if pending_poll_ids else 1
+    @staticmethod
+    def get_live_results(message_id, guild: discord.Guild) -> dict or None:
+        """Count the votes of the live tally if the poll displays its results live, return None otherwise."""
+        poll_data = Poll.pending_polls[message_id]
+        if not poll_data.get('is_live'):
+            return None
+        emoji_list = [
+            emoji for emoji_code in poll_data['emoji_codes']
+            if (emoji := utils.try_get_emoji(zbot.bot.emojis, emoji_code, error=None))
+        ]
+        return Poll.count_tally_votes(
+            Poll.pending_polls.get_tally(message_id), guild, emoji_list, poll_data['is_exclusive'],
+            poll_data['required_role_name']
+        )
+
+    @staticmethod
+    def request_live_results_refresh(message_id):
+        if Poll.pending_polls[message_id].get('is_live'):
+            Poll.live_results_debouncer.request(message_id)
+
+    @staticmethod
+    def stop_live_results(message_id):
+        Poll.pending_polls.update(message_id, {'is_live': False}, persist=False)
+        Poll.live_results_debouncer.cancel(message_id)
+
+    @staticmethod
+    async def refresh_live_results(message_id):
+        """Edit the announce of a live poll with the running counts, without fetching the message."""
+        if message_id not in Poll.pending_polls:
+            return  # Closed or cancelled in the meantime
+        poll_data = Poll.pending_polls[message_id]
+        channel = zbot.bot.get_channel(poll_data['channel_id'])
+        embed = Poll.build_announce_embed(
+            poll_data['description'], poll_data['is_exclusive'], poll_data['required_role_name'],
+            zbot.bot.get_user(poll_data['organizer_id']), converter.from_timestamp(poll_data['next_run_time']),
+            channel.guild.roles, results=Poll.get_live_results(message_id, channel.guild)
+        )
+        await channel.get_partial_message(message_id).edit(embed=embed)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        message_id = payload.message_id
+        if message_id not in Poll.pending_polls or payload.user_id == zbot.bot.user.id:
+            return
+        vote_tally = Poll.pending_polls.get_tally(message_id)
+        emoji_code = utils.get_emoji_code(payload.emoji)
+        previous_option_codes = set(vote_tally.get_voter_options(payload.user_id))
+        if not vote_tally.add_vote(emoji_code, payload.user_id):
+            return  # Not an option of the poll
+        Poll.request_live_results_refresh(message_id)
+
+        # Reject the vote without fetching the message, from the live tally
+        user = payload.member
+        if not user or user.bot:
+            return
+        rejection_message = None
+        if required_role_name := Poll.pending_polls[message_id]['required_role_name']:
+            if not checker.has_role(user, required_role_name):
+                rejection_message = f"Vous devez avoir le rôle @{required_role_name} pour participer à ce sondage."
+        if not rejection_message and Poll.pending_polls[message_id]['is_exclusive']:
+            if previous_option_codes - {emoji_code}:
+                rejection_message = "Vous ne pouvez voter que pour une seule option."
+        if rejection_message:
+            try:
+                await utils.try_dm(user, rejection_message)
+                message = self.guild.get_channel(payload.channel_id).get_partial_message(message_id)
+                await message.remove_reaction(payload.emoji, user)  # The tally is updated by the removal event
+            except (
+                    discord.errors.HTTPException,
+                    discord.errors.NotFound,
+                    discord.errors.Forbidden
+            ):
+                pass
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if payload.message_id in Poll.pending_polls and payload.user_id != zbot.bot.user.id:
+            if Poll.pending_polls.get_tally(payload.message_id).remove_vote(
+                utils.get_emoji_code(payload.emoji), payload.user_id
+            ):
+                Poll.request_live_results_refresh(payload.message_id)
 
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
-        message = reaction.message
-        message_id = message.id
-        emoji = reaction.emoji
-        if message_id in Poll.pending_polls:
-            poll_emoji_codes = Poll.pending_polls[message_id]['emoji_codes']
-            same_emoji = any([
-                emoji == poll_emoji_code if isinstance(emoji, str) else emoji.id == poll_emoji_code
-                for poll_emoji_code in poll_emoji_codes
-            ])
-            if same_emoji and not user.bot:
-                if required_role_name := Poll.pending_polls[message_id]['required_role_name']:
-                    if not checker.has_guild_role(self.guild, user, required_role_name):
-                        try:
-                            await utils.try_dm(
-                                user, f"Vous devez avoir le rôle @{required_role_name} pour "
-                                      f"participer à ce sondage."
-                            )
-                            await message.remove_reaction(emoji, user)
-                            return  # Don't enter other check blocks
-                        except (
-                                discord.errors.HTTPException,
-                                discord.errors.NotFound,
-                                discord.errors.Forbidden
-                        ):
-                            pass
-                if Poll.pending_polls[message_id]['is_exclusive']:
-                    for existing_reaction in list(filter(
-                        lambda r: r.emoji != emoji and
-                        (r.emoji if isinstance(r.emoji, str) else r.emoji.id) in poll_emoji_codes,
-                        message.reactions
-                    )):
-                        existing_reaction_users = await existing_reaction.users().flatten()
-                        if discord.utils.get(existing_reaction_users, id=user.id):
-                            try:
-                                await utils.try_dm(
-                                    user, f"Vous ne pouvez voter que pour une seule option."
-                                )
-                                await message.remove_reaction(emoji, user)
-                                return  # Don't enter other check blocks
-                            except (
-                                    discord.errors.HTTPException,
-                                    discord.errors.NotFound,
-                                    discord.errors.Forbidden
-                            ):
-                                pass
-                            break
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        if payload.message_id in Poll.pending_polls:
+            vote_tally = Poll.pending_polls.get_tally(payload.message_id)
+            for emoji_code in vote_tally.voters:
+                vote_tally.set_voters(emoji_code, [])
+            Poll.request_live_results_refresh(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
+        if payload.message_id in Poll.pending_polls:
+            Poll.pending_polls.get_tally(payload.message_id).set_voters(utils.get_emoji_code(payload.emoji), [])
+            Poll.request_live_results_refresh(payload.message_id)
 
     @poll.command(
         name='list',
@@ -270,12 +363,19 @@ class Poll(_command.Command):
         poll_id = Poll.pending_polls[message_id]['poll_id']
         message, channel, emoji_list, is_exclusive, required_role_name, time, organizer = \
             await Poll.get_message_env(poll_id)
+        Poll.stop_live_results(message_id)  # The announce is about to be replaced
         try:
-            reactions, results = await Poll.count_votes(
-                message, emoji_list, is_exclusive, required_role_name)
-            for reaction in reactions:
-                await reaction.remove(zbot.bot.user)
-            await message.unpin()
+            reactions = [
+                utils.try_get(message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji)
+                for emoji in emoji_list
+            ]
+            await Poll.reconcile_vote_tally(message)
+            results = Poll.count_tally_votes(
+                Poll.pending_polls.get_tally(message_id), message.guild, emoji_list, is_exclusive, required_role_name
+            )
+            await dispatcher.update_reactions(
+                message, remove_emojis=[reaction.emoji for reaction in reactions], pin=False
+            )
             await Poll.announce_results(
                 results, message, channel, is_exclusive, required_role_name, organizer
             )
@@ -306,11 +406,10 @@ class Poll(_command.Command):
         if context.author != organizer:
             checker.has_any_mod_role(context, print_error=True)
         if message:
+            self.stop_live_results(message.id)
             for emoji in emoji_list:
-                reaction = utils.try_get(
-                    message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji
-                )
-                await reaction.remove(zbot.bot.user)
+                utils.try_get(message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji)
+            await dispatcher.update_reactions(message, remove_emojis=emoji_list, pin=False)
             embed = discord.Embed(
                 title=f"Sondage __annulé__ par {context.author.display_name}",
                 description=message.embeds[0].description if message.embeds[0].description else "",
@@ -318,7 +417,6 @@ class Poll(_command.Command):
             )
             embed.set_author(name=f"Organisateur : @{organizer.display_name}", icon_url=organizer.avatar_url)
             await message.edit(embed=embed)
-            await message.unpin()
         self.remove_pending_poll(message.id, cancel_job=True)
         await context.send(f"Sondage d'identifiant `{poll_id}` annulé : <{message.jump_url}>")
 
@@ -403,8 +501,11 @@ class Poll(_command.Command):
             raise exceptions.ForbiddenChannel(channel)
 
         embed = self.build_announce_embed(
-            description, is_exclusive, required_role_name, organizer, time, self.guild.roles)
+            description, is_exclusive, required_role_name, organizer, time, self.guild.roles,
+            results=self.get_live_results(message.id, self.guild)
+        )
         await message.edit(embed=embed)
+        self.pending_polls.update(message.id, {'description': description})
         await context.send(
             f"Description du sondage d'identifiant `{poll_id}` remplacée par "
             f"\"`{description}`\" : <{message.jump_url}>"
@@ -457,24 +558,22 @@ class Poll(_command.Command):
             )
             for previous_emoji in previous_emoji_list
         ]
-        for previous_reaction in previous_reactions:
-            await previous_reaction.remove(zbot.bot.user)
-        for emoji in emoji_list:
-            await message.add_reaction(emoji)
-        embed = self.build_announce_embed(
-            message.embeds[0].description, is_exclusive, required_role_name, organizer, time,
-            self.guild.roles
+        await dispatcher.update_reactions(
+            message, add_emojis=emoji_list, remove_emojis=[reaction.emoji for reaction in previous_reactions]
         )
-        await message.edit(embed=embed)
 
-        job_id = self.pending_polls[message.id]['_id']
-        poll_data = {
-            'emoji_codes': list(map(lambda e: e if isinstance(e, str) else e.id, emoji_list)),
+        emoji_codes = list(map(lambda e: e if isinstance(e, str) else e.id, emoji_list))
+        self.pending_polls.update(message.id, {
+            'emoji_codes': emoji_codes,
             'is_exclusive': is_exclusive,
             'required_role_name': required_role_name
-        }
-        zbot.db.update_poll_data(job_id, poll_data)
-        self.pending_polls[message.id].update(poll_data)
+        })
+        self.pending_polls.get_tally(message.id).set_options(emoji_codes)
+        embed = self.build_announce_embed(
+            message.embeds[0].description, is_exclusive, required_role_name, organizer, time,
+            self.guild.roles, results=self.get_live_results(message.id, self.guild)
+        )
+        await message.edit(embed=embed)
         await context.send(
             f"Émojis du sondage d'identifiant `{poll_id}` mis à jour : <{message.jump_url}>"
         )
@@ -504,14 +603,11 @@ class Poll(_command.Command):
 
         embed = self.build_announce_embed(
             message.embeds[0].description, is_exclusive, required_role_name, organizer, time,
-            self.guild.roles
+            self.guild.roles, results=self.get_live_results(message.id, self.guild)
         )
         await message.edit(embed=embed)
 
-        job_id = self.pending_polls[message.id]['_id']
-        poll_data = {'organizer_id': organizer.id}
-        zbot.db.update_poll_data(job_id, poll_data)
-        self.pending_polls[message.id].update(poll_data)
+        self.pending_polls.update(message.id, {'organizer_id': organizer.id})
         await context.send(
             f"Organisateur du sondage d'identifiant `{poll_id}` remplacé par "
             f"`@{organizer.display_name}` : <{message.jump_url}>"
@@ -543,14 +639,13 @@ class Poll(_command.Command):
 
         embed = self.build_announce_embed(
             message.embeds[0].description, is_exclusive, required_role_name, organizer, time,
-            self.guild.roles
+            self.guild.roles, results=self.get_live_results(message.id, self.guild)
         )
         await message.edit(embed=embed)
 
         job_id = self.pending_polls[message.id]['_id']
         scheduler.reschedule_stored_job(job_id, time)  # Also updates the next_run_time in db
-        poll_data = {'next_run_time': converter.to_timestamp(time)}
-        self.pending_polls[message.id].update(poll_data)
+        self.pending_polls.update(message.id, {'next_run_time': converter.to_timestamp(time)}, persist=False)
         await context.send(
             f"Date et heure du sondage d'identifiant `{poll_id}` changées pour le "
             f"`{converter.to_human_format(time)}` : <{message.jump_url}>"
@@ -560,10 +655,7 @@ class Poll(_command.Command):
     async def get_message_env(poll_id: int, raise_if_not_found=True) -> \
             (discord.Message, discord.TextChannel, typing.List[typing.Union[str, discord.Emoji]],
              bool, bool, datetime.datetime, discord.Member):
-        if not (poll_data := discord.utils.find(
-                lambda data: data['poll_id'] == poll_id,
-                Poll.pending_polls.values()
-        )):
+        if not (poll_data := Poll.pending_polls.get_by_public_id(poll_id)):
             raise exceptions.UnknownPoll(poll_id)
         channel = zbot.bot.get_channel(poll_data['channel_id'])
         message = await utils.try_get_message(
@@ -587,13 +679,10 @@ class Poll(_command.Command):
     def remove_pending_poll(message_id, cancel_job=False):
         if message_id not in Poll.pending_polls:
             return  # Callback of misfired poll or manual run
-        for poll_data in Poll.pending_polls.values():
-            if poll_data['poll_id'] > Poll.pending_polls[message_id]['poll_id']:
-                poll_data['poll_id'] -= 1
-                zbot.db.update_poll_data(poll_data['_id'], {'poll_id': poll_data['poll_id']})
+        poll_data = Poll.pending_polls.remove(message_id)
+        Poll.live_results_debouncer.cancel(message_id)
         if cancel_job:
-            scheduler.cancel_stored_job(Poll.pending_polls[message_id]['_id'])
-        del Poll.pending_polls[message_id]
+            scheduler.cancel_stored_job(poll_data['_id'])
 
     @poll.command(
         name='simulate',
@@ -660,24 +749,32 @@ class Poll(_command.Command):
             utils.try_get(message.reactions, error=exceptions.MissingEmoji(emoji), emoji=emoji)
             for emoji in emoji_list
         ]
-        votes = {reaction.emoji: await reaction.users().flatten() for reaction in reactions}
-        results = {}
-        for emoji, voters in votes.items():
-            valid_votes_count = 0
-            for voter in voters:
-                if voter.bot:
-                    continue  # Exclude bot votes
-                if is_exclusive and any([voter in votes[other_emoji] for other_emoji in votes
-                                         if other_emoji != emoji]):
-                    continue  # Only count vote of voters having voted once in exclusive mode
-                if required_role_name and not checker.has_guild_role(
-                        message.guild, voter, required_role_name
-                ):
-                    continue  # Only count vote of voters having the required role, if set
-                valid_votes_count += 1
-            results[emoji] = valid_votes_count
+        vote_tally = tally.VoteTally(utils.get_emoji_code(emoji) for emoji in emoji_list)
+        for reaction in reactions:
+            vote_tally.set_voters(
+                utils.get_emoji_code(reaction.emoji), [user.id for user in await reaction.users().flatten()]
+            )
+        results = Poll.count_tally_votes(vote_tally, message.guild, emoji_list, is_exclusive, required_role_name)
         return reactions, results
 
+    @staticmethod
+    def count_tally_votes(vote_tally, guild, emoji_list, is_exclusive, required_role_name):
+        """Compute the results of the poll from its live vote tally."""
+        tally_results = vote_tally.count(
+            is_exclusive, lambda voter_id: Poll.is_valid_voter(guild, voter_id, required_role_name)
+        )
+        return {emoji: tally_results.get(utils.get_emoji_code(emoji), 0) for emoji in emoji_list}
+
+    @staticmethod
+    def is_valid_voter(guild: discord.Guild, voter_id: int, required_role_name) -> bool:
+        """Return True if the voter is not a bot and has the required role, if set."""
+        voter = guild.get_member(voter_id) or zbot.bot.get_user(voter_id)
+        if voter and voter.bot:
+            return False  # Exclude bot votes
+        if required_role_name:  # Only count vote of voters having the required role, if set
+            return isinstance(voter, discord.Member) and bool(checker.has_role(voter, required_role_name))
+        return True
+
     @staticmethod
     async def announce_results(
             results: dict, src_message: discord.Message, channel: discord.TextChannel, is_exclusive,
@@ -1,18 +1,22 @@
 import datetime
+import functools
 import io
-import math
+import typing
 
 import discord
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
+import numpy as np
 from discord.ext import commands
 from discord.ext import tasks
 
 from zbot import checker
 from zbot import converter
 from zbot import exceptions
+from zbot import export
+from zbot import graph
+from zbot import guild_stats
+from zbot import hyperloglog
 from zbot import logger
+from zbot import timeseries
 from zbot import utils
 from zbot import zbot
 from . import _command
@@ -31,9 +35,14 @@ class Server(_command.Command):
     EMBED_COLOR = 0x91b6f2  # Pastel blue
 
     SERVER_STATS_RECORD_FREQUENCY = datetime.timedelta(hours=1)  # How often server stats are recorded
+    MESSAGE_COUNTERS_CHECKPOINT_FREQUENCY = datetime.timedelta(minutes=5)  # How often message counters are persisted
+    GUILD_STATS_REFRESH_FREQUENCY = datetime.timedelta(hours=6)  # How often role sizes and ban count are recomputed
     HOURS_GRANULARITY_LIMIT = 3  # In days, the maximum time-frame (excl.) to display records on a datetime axis
     DAYS_GRANULARITY_LIMIT = 365  # In days, the maximum time-frame (excl.) to display records on a day-to-day date axis
     MONTHS_GRANULARITY_LIMIT = 365 * 2  # In days, the maximum time-frame (excl.) to display records on a month axis
+    GRANULARITY_UNITS = {  # Buckets of the records: exact time on a datetime axis, average per day on a date axis
+        'hour': None, 'day': timeseries.DAY_UNIT, 'month': timeseries.DAY_UNIT, 'year': timeseries.DAY_UNIT,
+    }
     DISCUSSION_CHANNELS = [
         'général', 'gameplay', 'mentorat', 'actualités', 'promotion', 'recrutement', 'suggestions', 'memes']
     PRIMARY_ROLES = [
@@ -42,7 +51,123 @@ class Server(_command.Command):
 
     def __init__(self, bot):
         super().__init__(bot)
+        self.startup_time = utils.utc_now()
+        self.message_counters = {  # {channel_id: count}, messages posted since the start of the counting window
+            utils.try_get(self.guild.channels, name=channel_name).id: 0 for channel_name in self.DISCUSSION_CHANNELS
+        }
+        self.active_authors = {  # {channel_id: sketch}, distinct authors since the start of the counting window
+            channel_id: hyperloglog.HyperLogLog() for channel_id in self.message_counters
+        }
+        self.join_count, self.leave_count = 0, 0  # Members who joined or left since the start of the counting window
+        self.message_counting_start = self.startup_time  # Start of the counting window
+        self.last_server_stats_record_date = zbot.db.get_metadata('last_server_stats_record')
+        self.graph_cache = graph.RenderCache()
+        self.guild_stats = guild_stats.GuildStatsCache(self.guild, self.PRIMARY_ROLES)
         self.record_server_stats.start()
+        self.refresh_guild_stats.start()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.channel.id in self.message_counters:
+            self.message_counters[message.channel.id] += 1
+            if not message.author.bot:
+                self.active_authors[message.channel.id].add(message.author.id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.cached_message:
+            self.discount_message(payload.cached_message)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for message in payload.cached_messages:
+            self.discount_message(message)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.guild_stats.count_member(member, 1)
+        self.join_count += 1
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.guild_stats.count_member(member, -1)
+        self.leave_count += 1
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.guild_stats.update_member(before, after)
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, _guild: discord.Guild, _user: discord.User):
+        self.guild_stats.count_ban(1)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, _guild: discord.Guild, _user: discord.User):
+        self.guild_stats.count_ban(-1)
+
+    @tasks.loop(seconds=GUILD_STATS_REFRESH_FREQUENCY.seconds)
+    async def refresh_guild_stats(self):
+        await self.guild_stats.refresh()
+
+    def discount_message(self, message: discord.Message):
+        """Decrement the counter of the channel if the message was counted in the current window."""
+        if message.channel.id in self.message_counters \
+                and converter.to_utc(message.created_at) >= self.message_counting_start:
+            self.message_counters[message.channel.id] = max(self.message_counters[message.channel.id] - 1, 0)
+
+    @tasks.loop(seconds=MESSAGE_COUNTERS_CHECKPOINT_FREQUENCY.seconds)
+    async def checkpoint_message_counters(self):
+        self.save_message_counters()
+
+    def save_message_counters(self):
+        zbot.db.update_metadata('message_counters_checkpoint', {
+            'counting_start': self.message_counting_start,
+            'time': utils.utc_now(),
+            'counts': [
+                {'channel_id': channel_id, 'count': count} for channel_id, count in self.message_counters.items()
+            ],
+            'active_authors': [
+                {'channel_id': channel_id, 'registers': sketch.to_bytes()}
+                for channel_id, sketch in self.active_authors.items()
+            ],
+            'joins': self.join_count,
+            'leaves': self.leave_count,
+        })
+
+    async def restore_message_counters(self):
+        """Restore the counters from the last checkpoint and count the messages posted while the bot was offline."""
+        counting_start_limit = self.startup_time - self.SERVER_STATS_RECORD_FREQUENCY
+        checkpoint = zbot.db.get_metadata('message_counters_checkpoint')
+        if checkpoint and converter.to_utc(checkpoint['counting_start']) >= counting_start_limit:
+            self.message_counting_start = converter.to_utc(checkpoint['counting_start'])
+            backfill_start = converter.to_utc(checkpoint['time'])
+            for count_data in checkpoint['counts']:
+                if count_data['channel_id'] in self.message_counters:
+                    self.message_counters[count_data['channel_id']] += count_data['count']
+            for sketch_data in checkpoint.get('active_authors', []):
+                if sketch_data['channel_id'] in self.active_authors:
+                    self.active_authors[sketch_data['channel_id']].merge(
+                        hyperloglog.HyperLogLog(registers=sketch_data['registers'])
+                    )
+            self.join_count += checkpoint.get('joins', 0)
+            self.leave_count += checkpoint.get('leaves', 0)
+        else:  # The window of the checkpoint, if any, was never recorded: only count the messages of the last hour
+            last_server_stats_record_date = zbot.db.get_metadata('last_server_stats_record')
+            self.message_counting_start = backfill_start = max(
+                converter.to_utc(last_server_stats_record_date) if last_server_stats_record_date
+                else counting_start_limit,
+                counting_start_limit
+            )
+        # Messages posted since the startup are counted by the listener, members who joined or left offline are not
+        for channel_id in self.message_counters:
+            async for message in self.guild.get_channel(channel_id).history(
+                limit=None, after=backfill_start.replace(tzinfo=None), before=self.startup_time.replace(tzinfo=None)
+            ):
+                self.message_counters[channel_id] += 1
+                if not message.author.bot:
+                    self.active_authors[channel_id].add(message.author.id)
+        logger.debug(f"Restored message counters since {self.message_counting_start}: {self.message_counters}")
+        self.checkpoint_message_counters.start()  # Only overwrite the checkpoint once restored
 
     @tasks.loop(seconds=SERVER_STATS_RECORD_FREQUENCY.seconds)
     async def record_server_stats(self):
@@ -60,22 +185,50 @@ class Server(_command.Command):
                 return
 
         await self.record_member_count(now)
-        await self.record_message_count(now)
+        await self.record_member_flow(now)
+        await self.record_role_counts(now)
+        await self.record_active_author_count(now)
+        await self.record_message_count(now)  # Start the new counting window last
         zbot.db.update_metadata('last_server_stats_record', now)
+        self.last_server_stats_record_date = now  # Invalidate the rendered graphs
+        self.save_message_counters()  # Save the start of the new counting window
+
+    @record_server_stats.before_loop
+    async def before_record_server_stats(self):
+        await self.restore_message_counters()  # Don't record counts before the downtime is backfilled
 
     async def record_member_count(self, time):
         zbot.db.insert_timed_member_count(time, self.guild.member_count)
 
+    async def record_member_flow(self, time):
+        zbot.db.insert_timed_member_flow(time, self.join_count, self.leave_count)
+
+    async def record_role_counts(self, time):
+        if self.guild_stats.is_loaded:
+            role_counts = [
+                {'count': count, 'role_name': role_name}
+                for role_name, count in self.guild_stats.get_role_sizes().items()
+            ]
+            zbot.db.insert_timed_role_counts(time, role_counts)
+
+    async def record_active_author_count(self, time):
+        all_active_authors = hyperloglog.HyperLogLog()
+        for sketch in self.active_authors.values():
+            all_active_authors.merge(sketch)
+        active_author_counts = [
+            {'count': sketch.count(), 'channel_id': channel_id} for channel_id, sketch in self.active_authors.items()
+        ] + [{'count': all_active_authors.count(), 'channel_id': None}]  # Distinct authors across all channels
+        zbot.db.insert_timed_active_author_counts(time, active_author_counts)
+
     async def record_message_count(self, time):
-        message_counts = []
-        for channel_name in self.DISCUSSION_CHANNELS:
-            channel = utils.try_get(self.guild.channels, name=channel_name)
-            channel_message_count = len(await channel.history(
-                after=converter.to_utc(time - datetime.timedelta(hours=1)).replace(tzinfo=None),
-                limit=999
-            ).flatten())
-            message_counts.append({'count': channel_message_count, 'channel_id': channel.id})
+        message_counts = [
+            {'count': count, 'channel_id': channel_id} for channel_id, count in self.message_counters.items()
+        ]
         zbot.db.insert_timed_message_counts(time, message_counts)
+        self.message_counters = dict.fromkeys(self.message_counters, 0)
+        self.active_authors = {channel_id: hyperloglog.HyperLogLog() for channel_id in self.message_counters}
+        self.join_count, self.leave_count = 0, 0
+        self.message_counting_start = converter.to_utc(time)
 
     @commands.command(
         name='members',
@@ -88,10 +241,9 @@ class Server(_command.Command):
     @commands.check(checker.has_any_user_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def members(self, context: commands.Context):
-        role_sizes = {}
-        for primary_role_name in self.PRIMARY_ROLES:
-            guild_role = utils.try_get(context.guild.roles, name=primary_role_name)
-            role_sizes[primary_role_name] = len(guild_role.members)
+        if not self.guild_stats.is_loaded:  # The first refresh is still pending
+            await self.guild_stats.refresh()
+        role_sizes = self.guild_stats.get_role_sizes()
 
         embed = discord.Embed(
             title=f"Décompte des membres du serveur",
@@ -102,12 +254,12 @@ class Server(_command.Command):
         for role_name in self.PRIMARY_ROLES:
             embed.add_field(
                 name=role_name,
-                value=f"**{role_sizes[role_name]}** membres",
+                value=f"**{role_sizes.get(role_name, 0)}** membres",
                 inline=True
             )
         embed.add_field(
             name="Banni",
-            value=f"**{len(await context.guild.bans())}** boulets",
+            value=f"**{self.guild_stats.ban_count}** boulets",
             inline=True
         )
         await context.send(embed=embed)
@@ -129,57 +281,58 @@ class Server(_command.Command):
     @graph.command(
         name='members',
         aliases=['membres'],
-        usage="[--time=days] [--hour|--day|--month|--year]",
+        usage="[--time=days] [--hour|--day|--month|--year] [--export=csv|json]",
         brief="Affiche le total des membres du serveur au cours du temps",
         help="Par défaut, une période de 30 jours est utilisée. Pour changer cela il faut fournir l'argument "
              "`--time=days` où `days` est le nombre de jours à considérer. L'axe du temps est automatiquement ajusté "
              "au nombre de jours : Jusqu'à une période de 3 jours, 12 mois et 2 ans (exclus), l'axe affiche "
              "respectivement des heures, des jours et des mois. Pour forcer un type d'affichage, il faut fournir l'un "
              "des arguments suivants : `--hour`, `--day`, `--month`, `--year`. Il est également possible de scinder "
-             "l'affichage par rôle en fournissant l'argument `--split`.",
+             "l'affichage par rôle en fournissant l'argument `--split`. "
+             "Pour obtenir les données du graphique plutôt que son image, il faut fournir l'argument "
+             f"`--export=format` où `format` est l'un des formats suivants : {', '.join(export.EXPORT_FORMATS)}.",
         ignore_extra=True,
     )
     @commands.check(checker.has_any_user_role)
     @commands.check(checker.is_allowed_in_current_guild_channel)
     async def graph_members(self, context, *, options=""):
         days_number, granularity = await self.parse_time_arguments(options)
+        if export_format := self.parse_export_argument(options):
+            return await self.send_export(
+                context, export_format, 'members', zbot.db.MEMBER_COUNT_COLLECTION, {}, ['count'], days_number,
+                granularity
+            )
+        await self.send_graph(
+            context, ('members', days_number, granularity), self.load_member_series, days_number, granularity,
+            "Nombre de membres"
+        )
 
+    @staticmethod
+    def load_member_series(time_limit, granularity) -> typing.List[graph.Series]:
         # Load, compute and reshape data
-        today = utils.community_tz_now()
-        time_limit = today - datetime.timedelta(days=days_number)
         member_counts_data = zbot.db.load_member_counts(
             {'time': {'$gt': converter.to_utc(time_limit)}}, ['time', 'count']
         )
-        times, counts = [], []
-        if granularity == 'hour':  # Plot the time and exact value to place the dot accurately
-            for data in member_counts_data:
-                localized_time = converter.to_community_tz(converter.to_utc(data['time'])).replace(tzinfo=None)
-                times.append(localized_time)
-                counts.append(data['count'])
-        elif granularity in ('day', 'month', 'year'):  # Only plot the date, and average value to align with the tick
-            counts_by_date = {}
-            for data in member_counts_data:
-                localized_time = converter.to_community_tz(converter.to_utc(data['time']))
-                counts_by_date.setdefault(localized_time.date(), []).append(data['count'])
-            times.extend(counts_by_date.keys())
-            counts.extend([round(sum(date_counts) / len(date_counts)) for date_counts in counts_by_date.values()])
-
-        plt.plot(times, counts, linestyle='-', marker='.', alpha=0.75)
-
-        self.configure_plot(days_number, time_limit, today, min(counts), max(counts), "Nombre de membres", granularity)
-        await context.send(file=self.render_graph())
+        times = timeseries.localize(
+            timeseries.to_datetime64(data['time'] for data in member_counts_data), converter.COMMUNITY_TIMEZONE
+        )
+        counts = np.array([data['count'] for data in member_counts_data], dtype=np.int64)
+        times, counts = timeseries.aggregate(times, counts, Server.GRANULARITY_UNITS[granularity])
+        return [Server.make_series(times, counts)]
 
     @graph.command(
         name='messages',
         aliases=['message'],
-        usage="[--time=days] [--hour|--day|--month|--year] [--split]",
+        usage="[--time=days] [--hour|--day|--month|--year] [--split] [--export=csv|json]",
         brief="Affiche le nombre de messages postés lors de la dernière heure au cours du temps",
         help="Par défaut, une période de 2 jours est utilisée. Pour changer cela il faut fournir l'argument "
              "`--time=days` où `days` est le nombre de jours à considérer. L'axe du temps est automatiquement ajusté "
              "au nombre de jours : Jusqu'à une période de 3 jours, 12 mois et 2 ans (exclus), l'axe affiche "
              "respectivement des heures, des jours et des mois. Pour forcer un type d'affichage, il faut fournir l'un "
              "des arguments suivants : `--hour`, `--day`, `--month`, `--year`. Il est également possible de scinder "
-             "l'affichage par canal en fournissant l'argument `--split`.",
+             "l'affichage par canal en fournissant l'argument `--split`. "
+             "Pour obtenir les données du graphique plutôt que son image, il faut fournir l'argument "
+             f"`--export=format` où `format` est l'un des formats suivants : {', '.join(export.EXPORT_FORMATS)}.",
         ignore_extra=True,
     )
     @commands.check(checker.has_any_user_role)
@@ -187,56 +340,209 @@ class Server(_command.Command):
     async def graph_messages(self, context, *, options=""):
         days_number, granularity = await self.parse_time_arguments(options, default_days_number=2)
         do_split = utils.is_option_enabled(options, 'split')
+        if export_format := self.parse_export_argument(options):
+            return await self.send_export(
+                context, export_format, 'messages', zbot.db.MESSAGE_COUNT_COLLECTION, {}, ['count'], days_number,
+                granularity, key_name='channel_id', do_split=do_split
+            )
+        await self.send_graph(
+            context, ('messages', days_number, granularity, do_split),
+            functools.partial(self.load_message_series, do_split=do_split), days_number, granularity,
+            "Nombre de messages horaires"
+        )
 
-        # Load, compute and reshape data
-        today = utils.community_tz_now()
-        time_limit = today - datetime.timedelta(days=days_number)
+    def load_message_series(self, time_limit, granularity, do_split=False) -> typing.List[graph.Series]:
         message_counts_data = zbot.db.load_message_counts(
             {'time': {'$gt': converter.to_utc(time_limit)}}, ['time', 'count', 'channel_id']
         )
-        times_by_channel, counts_by_channel = {}, {}
-        if granularity == 'hour':  # Plot the time and exact value to place the dot accurately
-            for data in message_counts_data:
-                localized_time = converter.to_community_tz(converter.to_utc(data['time'])).replace(tzinfo=None)
-                times_by_channel.setdefault(data['channel_id'], []).append(localized_time)
-                counts_by_channel.setdefault(data['channel_id'], []).append(data['count'])
-        elif granularity in ('day', 'month', 'year'):  # Only plot the date, and average value to align with the tick
-            counts_by_channel_and_time = {}
-            for data in message_counts_data:
-                localized_time = converter.to_community_tz(converter.to_utc(data['time']))
-                counts_by_channel_and_time.setdefault(data['channel_id'], {}) \
-                    .setdefault(localized_time.date(), []).append(data['count'])
-            for channel, counts_by_date in counts_by_channel_and_time.items():
-                times_by_channel[channel] = list(counts_by_date.keys())
-                counts_by_channel[channel] = [
-                    round(sum(date_counts) / len(date_counts)) for date_counts in counts_by_date.values()
-                ]
-
-        min_count, max_count = float('inf'), -float('inf')
+        return self.build_series_list(
+            message_counts_data, 'channel_id', granularity, get_label=self.get_channel_label if do_split else None
+        )
+
+    @graph.command(
+        name='joins',
+        aliases=['arrivées', 'arrivals', 'départs', 'leaves'],
+        usage="[--time=days] [--hour|--day|--month|--year] [--export=csv|json]",
+        brief="Affiche le nombre de membres arrivés et partis lors de la dernière heure au cours du temps",
+        help="Par défaut, une période de 30 jours est utilisée. Pour changer cela il faut fournir l'argument "
+             "`--time=days` où `days` est le nombre de jours à considérer. L'axe du temps est automatiquement ajusté "
+             "au nombre de jours : Jusqu'à une période de 3 jours, 12 mois et 2 ans (exclus), l'axe affiche "
+             "respectivement des heures, des jours et des mois. Pour forcer un type d'affichage, il faut fournir l'un "
+             "des arguments suivants : `--hour`, `--day`, `--month`, `--year`. "
+             "Pour obtenir les données du graphique plutôt que son image, il faut fournir l'argument "
+             f"`--export=format` où `format` est l'un des formats suivants : {', '.join(export.EXPORT_FORMATS)}.",
+        ignore_extra=True,
+    )
+    @commands.check(checker.has_any_user_role)
+    @commands.check(checker.is_allowed_in_current_guild_channel)
+    async def graph_joins(self, context, *, options=""):
+        days_number, granularity = await self.parse_time_arguments(options)
+        if export_format := self.parse_export_argument(options):
+            return await self.send_export(
+                context, export_format, 'joins', zbot.db.MEMBER_FLOW_COLLECTION, {}, ['joins', 'leaves'], days_number,
+                granularity
+            )
+        await self.send_graph(
+            context, ('joins', days_number, granularity), self.load_member_flow_series, days_number, granularity,
+            "Arrivées et départs horaires"
+        )
+
+    @staticmethod
+    def load_member_flow_series(time_limit, granularity) -> typing.List[graph.Series]:
+        member_flows_data = zbot.db.load_member_flows(
+            {'time': {'$gt': converter.to_utc(time_limit)}}, ['time', 'joins', 'leaves']
+        )
+        counts_data = [  # Reshape into one count per flow, keyed by the label of the flow
+            {'time': data['time'], 'count': data[flow_key], 'flow': label}
+            for data in member_flows_data for flow_key, label in (('joins', "Arrivées"), ('leaves', "Départs"))
+        ]
+        return Server.build_series_list(counts_data, 'flow', granularity, get_label=str)
+
+    @graph.command(
+        name='roles',
+        aliases=['role', 'rôles', 'rôle'],
+        usage="[--time=days] [--hour|--day|--month|--year] [--export=csv|json]",
+        brief="Affiche le nombre de membres de chaque rôle principal au cours du temps",
+        help="Par défaut, une période de 30 jours est utilisée. Pour changer cela il faut fournir l'argument "
+             "`--time=days` où `days` est le nombre de jours à considérer. L'axe du temps est automatiquement ajusté "
+             "au nombre de jours : Jusqu'à une période de 3 jours, 12 mois et 2 ans (exclus), l'axe affiche "
+             "respectivement des heures, des jours et des mois. Pour forcer un type d'affichage, il faut fournir l'un "
+             "des arguments suivants : `--hour`, `--day`, `--month`, `--year`. "
+             "Pour obtenir les données du graphique plutôt que son image, il faut fournir l'argument "
+             f"`--export=format` où `format` est l'un des formats suivants : {', '.join(export.EXPORT_FORMATS)}.",
+        ignore_extra=True,
+    )
+    @commands.check(checker.has_any_user_role)
+    @commands.check(checker.is_allowed_in_current_guild_channel)
+    async def graph_roles(self, context, *, options=""):
+        days_number, granularity = await self.parse_time_arguments(options)
+        if export_format := self.parse_export_argument(options):
+            return await self.send_export(
+                context, export_format, 'roles', zbot.db.ROLE_COUNT_COLLECTION, {}, ['count'], days_number,
+                granularity, key_name='role_name', do_split=True
+            )
+        await self.send_graph(
+            context, ('roles', days_number, granularity), self.load_role_series, days_number, granularity,
+            "Nombre de membres par rôle"
+        )
+
+    @staticmethod
+    def load_role_series(time_limit, granularity) -> typing.List[graph.Series]:
+        role_counts_data = zbot.db.load_role_counts(
+            {'time': {'$gt': converter.to_utc(time_limit)}}, ['time', 'count', 'role_name']
+        )
+        return Server.build_series_list(role_counts_data, 'role_name', granularity, get_label=str)
+
+    @graph.command(
+        name='authors',
+        aliases=['auteurs', 'actifs', 'active'],
+        usage="[--time=days] [--hour|--day|--month|--year] [--split] [--export=csv|json]",
+        brief="Affiche le nombre de membres actifs lors de la dernière heure au cours du temps",
+        help="Un membre est actif s'il a posté au moins un message dans un canal de discussion. Par défaut, une "
+             "période de 2 jours est utilisée. Pour changer cela il faut fournir l'argument `--time=days` où `days` "
+             "est le nombre de jours à considérer. L'axe du temps est automatiquement ajusté au nombre de jours : "
+             "Jusqu'à une période de 3 jours, 12 mois et 2 ans (exclus), l'axe affiche respectivement des heures, des "
+             "jours et des mois. Pour forcer un type d'affichage, il faut fournir l'un des arguments suivants : "
+             "`--hour`, `--day`, `--month`, `--year`. Il est également possible de scinder l'affichage par canal en "
+             "fournissant l'argument `--split`. "
+             "Pour obtenir les données du graphique plutôt que son image, il faut fournir l'argument "
+             f"`--export=format` où `format` est l'un des formats suivants : {', '.join(export.EXPORT_FORMATS)}.",
+        ignore_extra=True,
+    )
+    @commands.check(checker.has_any_user_role)
+    @commands.check(checker.is_allowed_in_current_guild_channel)
+    async def graph_authors(self, context, *, options=""):
+        days_number, granularity = await self.parse_time_arguments(options, default_days_number=2)
+        do_split = utils.is_option_enabled(options, 'split')
+        if export_format := self.parse_export_argument(options):
+            return await self.send_export(
+                context, export_format, 'authors', zbot.db.ACTIVE_AUTHOR_COUNT_COLLECTION,
+                {'channel_id': {'$ne': None} if do_split else None}, ['count'], days_number, granularity,
+                key_name='channel_id', do_split=do_split
+            )
+        await self.send_graph(
+            context, ('authors', days_number, granularity, do_split),
+            functools.partial(self.load_active_author_series, do_split=do_split), days_number, granularity,
+            "Nombre de membres actifs horaires"
+        )
+
+    def load_active_author_series(self, time_limit, granularity, do_split=False) -> typing.List[graph.Series]:
+        # The counts of distinct authors can't be summed across channels, use the count recorded for all channels
+        active_author_counts_data = zbot.db.load_active_author_counts(
+            {'time': {'$gt': converter.to_utc(time_limit)}, 'channel_id': {'$ne': None} if do_split else None},
+            ['time', 'count', 'channel_id']
+        )
         if do_split:
-            for channel_id, times, channel_counts in zip(
-                    times_by_channel.keys(), times_by_channel.values(), counts_by_channel.values()
-            ):
-                channel_name = self.guild.get_channel(channel_id).name
-                plt.plot(times, channel_counts, label=f"#{channel_name}", linestyle='-', marker='.', alpha=0.75)
-                plt.legend()
-                if min(channel_counts) < min_count:
-                    min_count = min(channel_counts)
-                if max(channel_counts) > max_count:
-                    max_count = max(channel_counts)
-        else:
-            times = list(times_by_channel.values())[0]
-            counts = [0] * len(times)
-            for channel_counts in counts_by_channel.values():
-                for time_index, channel_count in enumerate(channel_counts):
-                    counts[time_index] += channel_count
-            plt.plot(times, counts, linestyle='-', marker='.', alpha=0.75)
-            min_count, max_count = min(counts), max(counts)
-
-        self.configure_plot(
-            days_number, time_limit, today, min_count, max_count, "Nombre de messages horaires", granularity
+            return self.build_series_list(
+                active_author_counts_data, 'channel_id', granularity, get_label=self.get_channel_label
+            )
+        return self.build_series_list(
+            [{**data, 'channel_id': 0} for data in active_author_counts_data], 'channel_id', granularity
+        )
+
+    @graph.command(
+        name='compare',
+        aliases=['comparer', 'comparaison'],
+        usage="[--time=days] [--hour|--day|--month|--year]",
+        brief="Compare le total des membres et le nombre de messages horaires au cours du temps",
+        help="Les deux séries sont superposées, avec le nombre de messages sur un axe secondaire. Par défaut, une "
+             "période de 30 jours est utilisée. Pour changer cela il faut fournir l'argument `--time=days` où `days` "
+             "est le nombre de jours à considérer. L'axe du temps est automatiquement ajusté au nombre de jours : "
+             "Jusqu'à une période de 3 jours, 12 mois et 2 ans (exclus), l'axe affiche respectivement des heures, des "
+             "jours et des mois. Pour forcer un type d'affichage, il faut fournir l'un des arguments suivants : "
+             "`--hour`, `--day`, `--month`, `--year`.",
+        ignore_extra=True,
+    )
+    @commands.check(checker.has_any_user_role)
+    @commands.check(checker.is_allowed_in_current_guild_channel)
+    async def graph_compare(self, context, *, options=""):
+        days_number, granularity = await self.parse_time_arguments(options)
+        await self.send_graph(
+            context, ('compare', days_number, granularity), self.load_comparison_series, days_number, granularity,
+            "Nombre de membres", secondary_count_name="Nombre de messages horaires"
         )
-        await context.send(file=self.render_graph())
+
+    def load_comparison_series(self, time_limit, granularity) -> typing.List[graph.Series]:
+        member_series = self.load_member_series(time_limit, granularity)[0]
+        message_series = self.load_message_series(time_limit, granularity)[0]
+        return [
+            member_series._replace(label="Membres"),
+            message_series._replace(label="Messages horaires", secondary=True),
+        ]
+
+    def get_channel_label(self, channel_id: int) -> str:
+        return f"#{channel.name}" if (channel := self.guild.get_channel(channel_id)) else str(channel_id)
+
+    @staticmethod
+    def build_series_list(counts_data, key_name, granularity, get_label=None) -> typing.List[graph.Series]:
+        """
+        Aggregate the counts of each key (e.g. channel id) into buckets of time.
+        :param counts_data: The records of counts, with their time and key
+        :param key_name: The name of the field of the records holding the key
+        :param get_label: The function returning the label of a key, to plot a series per key, or None to plot the sum
+            of the counts of all keys
+        """
+        times = timeseries.localize(
+            timeseries.to_datetime64(data['time'] for data in counts_data), converter.COMMUNITY_TIMEZONE
+        )
+        counts = np.array([data['count'] for data in counts_data], dtype=np.int64)
+        keys = np.array([data[key_name] for data in counts_data])
+        groups = timeseries.aggregate_by_key(times, counts, keys, Server.GRANULARITY_UNITS[granularity])
+
+        series_list = []
+        if get_label:
+            for key, (times, key_counts) in timeseries.split_by_key(*groups).items():
+                series_list.append(Server.make_series(times, key_counts, label=get_label(key)))
+        else:  # Sum the counts of all keys, aligned on the buckets of time
+            times, counts = timeseries.sum_aligned(*groups)
+            series_list.append(Server.make_series(times, counts))
+        return series_list
+
+    @staticmethod
+    def make_series(times, counts, label=None) -> graph.Series:
+        """Downsample the series to the width of the graph, so that any time-frame renders in a bounded time."""
+        times, counts = timeseries.downsample_lttb(times, counts, graph.MAX_POINTS)
+        return graph.Series(times.tolist(), counts.tolist(), label=label)
 
     @staticmethod
     async def parse_time_arguments(options, default_days_number=30):
@@ -270,53 +576,57 @@ class Server(_command.Command):
         return days_number, granularity
 
     @staticmethod
-    def configure_plot(days_number, time_limit, today, min_count, max_count, count_name, granularity):
-        # Set labels
-        plt.xlabel("Temps")
-        plt.ylabel(count_name)
-        years_number = today.year - time_limit.year
-        months_number = years_number * 12 + (today.month - time_limit.month)
-        if granularity == 'hour':
-            plt.title(f"{count_name} sur les {days_number * 24} dernières heures")
-        elif granularity == 'day':
-            plt.title(f"{count_name} sur les {days_number} derniers jours")
-        elif granularity == 'month':
-            plt.title(f"{count_name} sur les {months_number} derniers mois")
-        elif granularity == 'year':
-            plt.title(f"{count_name} sur les {years_number} dernières années")
-
-        # Format time axis to comply with granularity
-        if granularity == 'hour':
-            plt.xlim(left=time_limit.replace(tzinfo=None), right=today.replace(tzinfo=None))  # Make tz agnostic
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d/%m %H:%M'))
-            plt.gca().xaxis.set_major_locator(ticker.MaxNLocator(nbins=5))
-        else:
-            plt.xlim(left=time_limit, right=today)
-            if granularity == 'day':
-                plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
-                plt.gca().xaxis.set_major_locator(ticker.MaxNLocator(nbins=min(10, days_number)))
-            elif granularity == 'month':
-                plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m/%y'))
-                plt.gca().xaxis.set_major_locator(ticker.MaxNLocator(nbins=min(10, days_number)))
-            elif granularity == 'year':
-                plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m/%y'))
-                plt.gca().xaxis.set_major_locator(ticker.MaxNLocator(nbins=min(10, days_number)))
-
-        # Format count axis to show integers only, on 5 to 10 ticks
-        counts_range = max_count - min_count + 1
-        if counts_range < 10:  # Force the positioning of counts in the middle of the range
-            half_gap = (10 - counts_range) / 2
-            plt.ylim(bottom=min_count - math.floor(half_gap), top=max_count + math.ceil(half_gap))
-        plt.gca().yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _pos: str(int(y))))
-        plt.gca().yaxis.set_major_locator(ticker.MaxNLocator(nbins=10))
+    def parse_export_argument(options) -> str or None:
+        export_format = utils.get_option_value(options, 'export')
+        if export_format is not None:  # Value assigned
+            if export_format not in export.EXPORT_FORMATS:
+                raise exceptions.MisformattedArgument(export_format, ' ou '.join(export.EXPORT_FORMATS))
+        elif utils.is_option_enabled(options, 'export', has_value=True):  # No value assigned
+            raise exceptions.MisformattedArgument(export_format, ' ou '.join(export.EXPORT_FORMATS))
+        return export_format
 
     @staticmethod
-    def render_graph():
-        buffer = io.BytesIO()  # Instantiate I/O buffer
-        plt.gcf().savefig(buffer, format='png')  # Plot the graph and save it in the buffer
-        plt.clf()  # Clear the figure to avoid it being drawn over by following graphes
-        buffer.seek(0)  # Rewind the buffer to 0th byte
-        return discord.File(buffer, 'graph.png')
+    async def send_export(
+        context, export_format, file_name, collection_name, query, value_names, days_number, granularity,
+        key_name=None, do_split=False
+    ):
+        """
+        Send the aggregated series as a file, streamed from the database cursor without loading all the records.
+        :param query: The filter of the records, besides the time-frame
+        :param value_names: The names of the fields of the records holding the values to aggregate
+        :param key_name: The name of the field of the records holding the key (e.g. channel id) to aggregate separately
+        :param do_split: Whether to export a series per key, or the sum of the series of all keys
+        """
+        time_limit = utils.community_tz_now() - datetime.timedelta(days=days_number)
+        records = zbot.db.iterate_timed_data(
+            collection_name, {'time': {'$gt': converter.to_utc(time_limit)}, **query},
+            ['time', *value_names, *([key_name] if key_name else [])]
+        )
+        rows = export.aggregate_stream(records, value_names, Server.GRANULARITY_UNITS[granularity], key_name, do_split)
+        column_names = ['time', *([key_name] if do_split else []), *value_names]
+        with export.write_rows(rows, column_names, export_format) as file:
+            await context.send(file=discord.File(file, f'{file_name}.{export_format}'))
+
+    async def send_graph(
+        self, context, cache_key: tuple, load_series_list, days_number, granularity, count_name,
+        secondary_count_name=None
+    ):
+        """
+        Send the graph from the cache if it was rendered since the last stats record, or load its data and render it.
+        :param cache_key: The parameters of the graph, to which the time of the last stats record is appended
+        :param load_series_list: The function loading the series to plot, called as `f(time_limit, granularity)`
+        :param secondary_count_name: The name of the counts of the series plotted on the secondary axis, if any
+        """
+        cache_key = (*cache_key, self.last_server_stats_record_date)
+        if not (png_bytes := self.graph_cache.get(cache_key)):
+            today = utils.community_tz_now()
+            time_limit = today - datetime.timedelta(days=days_number)
+            series_list = load_series_list(time_limit, granularity)
+            png_bytes = await graph.render_async(
+                series_list, days_number, time_limit, today, count_name, granularity, secondary_count_name
+            )
+            self.graph_cache.put(cache_key, png_bytes)
+        await context.send(file=discord.File(io.BytesIO(png_bytes), 'graph.png'))
 
 
 def setup(bot):
@@ -56,9 +56,8 @@ class Special(_command.Command):
         if not checker.has_guild_role(context.guild, context.author, Stats.CLAN_CONTACT_ROLE_NAME):
             raise exceptions.MissingRoles([Stats.CLAN_CONTACT_ROLE_NAME])
 
-        recruitment_channel = self.guild.get_channel(Admin.RECRUITMENT_CHANNEL_ID)
-        all_recruitment_announces = await recruitment_channel.history().flatten()
-        recruitment_announces = list(filter(lambda a: a.author == context.author, all_recruitment_announces))
+        all_recruitment_announces = await Admin.recruitment_mirror.get_announces()
+        recruitment_announces = list(filter(lambda a: a.author_id == context.author.id, all_recruitment_announces))
         last_recruitment_announce = recruitment_announces and recruitment_announces[0]
 
         if not last_recruitment_announce:
@@ -86,9 +85,7 @@ class Special(_command.Command):
                     f"Ton annonce contient un embed, ce qui n'est pas autorisé. Utilise un raccourcisseur d'URLs comme "
                     f"<https://tinyurl.com> pour héberger tes liens."
                 )
-            if await Admin.check_recruitment_announces_timespan(
-                patched_context, recruitment_channel, [last_recruitment_announce]
-            ):
+            if await Admin.check_recruitment_announces_timespan(patched_context, [last_recruitment_announce]):
                 validation_succeeded = False
                 await context.send(
                     f"Ton annonce a été postée avant le délai minimum de {Admin.MIN_RECRUITMENT_ANNOUNCE_TIMESPAN} "
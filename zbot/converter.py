@@ -2,17 +2,19 @@ import datetime
 import re
 import typing
 
-import dateutil.parser
 import discord
-import emojis as emoji_lib
 import pytz
 import tzlocal
 from discord.ext import commands
 
 from zbot import zbot
 from . import exceptions
+from . import importer
 from . import utils
 
+dateutil_parser = importer.LazyModule('dateutil.parser')
+emoji_lib = importer.LazyModule('emojis')
+
 COMMUNITY_TIMEZONE = pytz.timezone('Europe/Brussels')
 DATABASE_TIMEZONE = pytz.timezone('UTC')
 
@@ -22,7 +24,7 @@ DATABASE_TIMEZONE = pytz.timezone('UTC')
 def to_datetime(instant: str, print_error=True) -> datetime.datetime:
     time = None
     try:
-        time = dateutil.parser.parse(instant)
+        time = dateutil_parser.parse(instant)
     except (ValueError, OverflowError):
         if print_error:
             raise exceptions.MisformattedArgument(instant, "YYYY-MM-MM HH:MM:SS")
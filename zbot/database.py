@@ -16,22 +16,32 @@ class MongoDBConnector:
 
     # TODO keep collection names in class scope but factorize
     ACCOUNT_DATA_COLLECTION = 'account_data'
+    ACTIVE_AUTHOR_COUNT_COLLECTION = 'active_author_count'
     AUTOMESSAGES_COLLECTION = 'automessage'
+    DRAW_LOG_COLLECTION = 'draw_log'  # Audit log of the seeds used for random draws
     MEMBER_COUNT_COLLECTION = 'member_count'
+    MEMBER_FLOW_COLLECTION = 'member_flow'  # Joins and leaves of members
     MESSAGE_COUNT_COLLECTION = 'message_count'
     METADATA_COLLECTION = 'metadata'  # Collection of data about bot jobs and data
     PENDING_LOTTERIES_COLLECTION = 'pending_lottery'
     PENDING_POLLS_COLLECTION = 'pending_poll'
     RECRUITMENT_ANNOUNCES_COLLECTION = 'recruitment_announce'
+    RECRUITMENT_MIRROR_COLLECTION = 'recruitment_mirror'  # Copy of the messages of the recruitment channel
+    ROLE_COUNT_COLLECTION = 'role_count'
     COLLECTIONS_CONFIG = {
         ACCOUNT_DATA_COLLECTION: {},
+        ACTIVE_AUTHOR_COUNT_COLLECTION: {},
         AUTOMESSAGES_COLLECTION: {},
+        DRAW_LOG_COLLECTION: {},
         MEMBER_COUNT_COLLECTION: {},
+        MEMBER_FLOW_COLLECTION: {},
         MESSAGE_COUNT_COLLECTION: {},
         METADATA_COLLECTION: {},
         PENDING_LOTTERIES_COLLECTION: {'is_jobstore': True},
         PENDING_POLLS_COLLECTION: {'is_jobstore': True},
         RECRUITMENT_ANNOUNCES_COLLECTION: {},
+        RECRUITMENT_MIRROR_COLLECTION: {},
+        ROLE_COUNT_COLLECTION: {},
     }
 
     def __init__(self):
@@ -77,6 +87,12 @@ class MongoDBConnector:
             data.append({k: document[k] for k in document if (not data_keys or k in data_keys)})
         return data
 
+    def iterate_timed_data(self, collection_name, query, data_keys):
+        """Iterate over the documents of a collection of timed records sorted by time, one batch at a time."""
+        projection = dict.fromkeys(data_keys, 1)
+        for document in self.database[collection_name].find(query, projection, sort=[('time', pymongo.ASCENDING)]):
+            yield {k: document[k] for k in document if k in data_keys}
+
     # Metadata
 
     def update_metadata(self, key, value):
@@ -121,6 +137,21 @@ class MongoDBConnector:
     def load_recruitment_announces_data(self, query, order: List[Tuple[str, int]]):
         return self._load_data(self.RECRUITMENT_ANNOUNCES_COLLECTION, query, sort=order)
 
+    def update_recruitment_mirror(self, announces_data):
+        if announces_data:
+            res = self.database[self.RECRUITMENT_MIRROR_COLLECTION].bulk_write([
+                pymongo.UpdateOne({'_id': announce_data['_id']}, {'$set': announce_data}, upsert=True)
+                for announce_data in announces_data
+            ])
+            logger.debug(f"Mirrored {res.upserted_count + res.modified_count} recruitment message(s).")
+
+    def delete_recruitment_mirror(self, message_ids):
+        res = self.database[self.RECRUITMENT_MIRROR_COLLECTION].delete_many({'_id': {'$in': list(message_ids)}})
+        logger.debug(f"Deleted {res.deleted_count} mirrored recruitment message(s).")
+
+    def load_recruitment_mirror(self):
+        return self._load_data(self.RECRUITMENT_MIRROR_COLLECTION, {})
+
     # Lottery, Poll
 
     def _update_job_data(self, collection_name, job_id, data):
@@ -144,6 +175,16 @@ class MongoDBConnector:
     def load_pending_lotteries_data(self, data_keys):
         return self._load_pending_jobs_data(self.PENDING_LOTTERIES_COLLECTION, data_keys)
 
+    def insert_draw_log(self, time: datetime.datetime, seed: int, message_id: int, player_count: int, winner_ids):
+        res = self.database[self.DRAW_LOG_COLLECTION].insert_one({
+            'time': time,
+            'seed': seed,
+            'message_id': message_id,
+            'player_count': player_count,
+            'winner_ids': list(winner_ids),
+        })
+        logger.debug(f"Inserted draw log of id {res.inserted_id}.")
+
     # Messaging
 
     def update_accounts_data(self, accounts_data):
@@ -195,24 +236,33 @@ class MongoDBConnector:
         )
         return account_anniversaries
 
-    def insert_automessage(self, automessage_id: int, message: str, channel: discord.TextChannel):
+    def insert_automessage(self, automessage_id: int, message: str, channel_id: int, weight: int):
         res = self.database[self.AUTOMESSAGES_COLLECTION].insert_one({
             'automessage_id': automessage_id,
             'message': message,
-            'channel_id': channel.id
+            'channel_id': channel_id,
+            'weight': weight,
         })
         logger.debug(f"Inserted auto-message of id {automessage_id} in document {res.inserted_id}.")
         return res.inserted_id
 
     def update_automessages(self, automessages_data):
-        for key, automessage_data in automessages_data.items():
-            self.database[self.AUTOMESSAGES_COLLECTION].update_one(
-                {'_id': key},
-                {'$set': automessage_data}
-            )
-
-    def delete_automessage(self, document_id):
-        self.database[self.AUTOMESSAGES_COLLECTION].delete_one({'_id': document_id})
+        if automessages_data:
+            self.database[self.AUTOMESSAGES_COLLECTION].bulk_write([
+                pymongo.UpdateOne({'_id': key}, {'$set': automessage_data})
+                for key, automessage_data in automessages_data.items()
+            ])
+
+    def delete_automessage(self, document_id, renumbered_automessages_data: dict = None):
+        """Delete an automessage and renumber the following ones in a single batch of writes."""
+        self.database[self.AUTOMESSAGES_COLLECTION].bulk_write([
+            pymongo.DeleteOne({'_id': document_id}),
+            *[
+                pymongo.UpdateOne({'_id': key}, {'$set': automessage_data})
+                for key, automessage_data in (renumbered_automessages_data or {}).items()
+            ],
+        ])
+        logger.debug(f"Deleted auto-message of document {document_id}.")
 
     def load_automessages(self, query, data_keys):
         return self._load_data(self.AUTOMESSAGES_COLLECTION, query, data_keys)
@@ -238,3 +288,34 @@ class MongoDBConnector:
 
     def load_message_counts(self, query, data_keys):
         return self._load_data(self.MESSAGE_COUNT_COLLECTION, query, data_keys)
+
+    def insert_timed_member_flow(self, time: datetime.datetime, join_count: int, leave_count: int):
+        res = self.database[self.MEMBER_FLOW_COLLECTION].insert_one({
+            'time': time,
+            'joins': join_count,
+            'leaves': leave_count,
+        })
+        logger.debug(f"Inserted timed member flow of id {res.inserted_id}.")
+
+    def load_member_flows(self, query, data_keys):
+        return self._load_data(self.MEMBER_FLOW_COLLECTION, query, data_keys)
+
+    def insert_timed_role_counts(self, time: datetime.datetime, role_counts: list):
+        res = self.database[self.ROLE_COUNT_COLLECTION].insert_many([{
+            'time': time,
+            **role_count,
+        } for role_count in role_counts])
+        logger.debug(f"Inserted {len(res.inserted_ids)} timed role count(s).")
+
+    def load_role_counts(self, query, data_keys):
+        return self._load_data(self.ROLE_COUNT_COLLECTION, query, data_keys)
+
+    def insert_timed_active_author_counts(self, time: datetime.datetime, active_author_counts: list):
+        res = self.database[self.ACTIVE_AUTHOR_COUNT_COLLECTION].insert_many([{
+            'time': time,
+            **active_author_count,
+        } for active_author_count in active_author_counts])
+        logger.debug(f"Inserted {len(res.inserted_ids)} timed active author count(s).")
+
+    def load_active_author_counts(self, query, data_keys):
+        return self._load_data(self.ACTIVE_AUTHOR_COUNT_COLLECTION, query, data_keys)
@@ -0,0 +1,57 @@
+import asyncio
+import datetime
+import typing
+
+import discord
+
+from . import logger
+
+
+class Debouncer:
+
+    """
+    Coalescing scheduler of updates, such as message edits, that would otherwise be triggered at each event.
+
+    Requests for a same key are merged so that the update runs at most once per interval, whatever the request rate.
+    The update is always run after the last request, and should thus rebuild its content from the latest state.
+    """
+
+    def __init__(self, interval: datetime.timedelta, update: typing.Callable[[typing.Hashable], typing.Awaitable]):
+        """
+        :param interval: The minimum delay between two updates of a same key
+        :param update: The coroutine function performing the update, called as `update(key)`
+        """
+        self.interval = interval.total_seconds()
+        self.update = update
+        self._pending_keys = set()  # Keys requested since their last update
+        self._last_update_times = {}  # {key: event loop time}
+        self._tasks = {}  # {key: task}, running until no request is left for the key
+
+    def request(self, key: typing.Hashable):
+        """Request an update of the key, run as soon as the interval since its last update has elapsed."""
+        self._pending_keys.add(key)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.get_event_loop().create_task(self._run(key))
+
+    def cancel(self, key: typing.Hashable):
+        """Drop the pending update of the key, if any."""
+        self._pending_keys.discard(key)
+        self._last_update_times.pop(key, None)
+        if task := self._tasks.pop(key, None):
+            task.cancel()
+
+    async def _run(self, key):
+        loop = asyncio.get_event_loop()
+        try:
+            while key in self._pending_keys:
+                if (delay := self._last_update_times.get(key, 0) + self.interval - loop.time()) > 0:
+                    await asyncio.sleep(delay)  # Requests received in the meantime are merged
+                self._pending_keys.discard(key)
+                self._last_update_times[key] = loop.time()
+                try:
+                    await self.update(key)
+                except discord.HTTPException as error:
+                    logger.error(error, exc_info=error)
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import http
+import typing
+
+import discord
+
+from . import logger
+
+DEFAULT_MAX_CONCURRENCY = 5  # Maximum number of requests in flight, well below the global rate limit
+MAX_RETRIES = 3  # Maximum number of retries of a rate limited request
+DEFAULT_RETRY_AFTER = 1  # In seconds, doubled on each retry if Discord doesn't provide the delay
+
+
+class DeliveryReport:
+
+    """Outcome of the delivery of direct messages, by recipient."""
+
+    def __init__(self):
+        self.sent = []  # Recipients who received all their messages
+        self.blocked = []  # Recipients who blocked their DMs
+        self.failed = []  # Recipients whose messages could not be sent for another reason
+
+    def __repr__(self):
+        return f"<DeliveryReport sent={len(self.sent)} blocked={len(self.blocked)} failed={len(self.failed)}>"
+
+
+async def dispatch(
+    operations_by_key: typing.Dict[typing.Hashable, typing.List[typing.Callable[[], typing.Awaitable]]],
+    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+    stop_on_error=True,
+    on_progress: typing.Callable[[int, int], None] = None,
+) -> dict:
+    """
+    Run queues of API requests concurrently, while preserving the order of the requests within each queue.
+    Requests of a same queue should target a same route (the DM channel of a recipient, a message, ...) so that queues
+    map to Discord rate limit buckets, whose locking is left to discord.py. Rate limited requests are retried.
+    :param operations_by_key: The queues of operations, each operation being a coroutine function without argument
+    :param max_concurrency: The maximum number of requests in flight, all queues included
+    :param stop_on_error: Whether the remaining operations of a queue are skipped after a failure
+    :param on_progress: The callback called after each operation with the number of completed and total operations
+    :return: The results of the operations of each queue, where failures are represented by the raised exception
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    total_count, completed_count = sum(map(len, operations_by_key.values())), 0
+
+    async def _run_queue(_operations):
+        nonlocal completed_count
+        _results = []
+        for _operation in _operations:
+            async with semaphore:
+                try:
+                    _results.append(await _run_with_retries(_operation))
+                except discord.HTTPException as error:
+                    _results.append(error)
+                    if stop_on_error:
+                        break
+                finally:
+                    completed_count += 1
+                    if on_progress:
+                        on_progress(completed_count, total_count)
+        return _results
+
+    keys = list(operations_by_key.keys())
+    queues_results = await asyncio.gather(*[_run_queue(operations_by_key[key]) for key in keys])
+    return dict(zip(keys, queues_results))
+
+
+async def _run_with_retries(operation):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await operation()
+        except discord.HTTPException as error:
+            if error.status != http.HTTPStatus.TOO_MANY_REQUESTS or attempt == MAX_RETRIES:
+                raise
+            retry_after = DEFAULT_RETRY_AFTER * 2 ** attempt
+            if (response := getattr(error, 'response', None)) is not None:
+                retry_after = float(response.headers.get('Retry-After', retry_after))
+            logger.debug(f"Rate limited, retrying in {retry_after} seconds.")
+            await asyncio.sleep(retry_after)
+
+
+async def send_dms(
+    messages_by_recipient: typing.Dict[discord.abc.User, typing.List[str]],
+    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+) -> DeliveryReport:
+    """Send direct messages to several recipients concurrently, in order for each recipient."""
+    results_by_recipient = await dispatch(
+        {
+            recipient: [functools.partial(recipient.send, content) for content in contents]
+            for recipient, contents in messages_by_recipient.items()
+        },
+        max_concurrency=max_concurrency,
+    )
+    report = DeliveryReport()
+    for recipient, results in results_by_recipient.items():
+        error = next((result for result in results if isinstance(result, discord.HTTPException)), None)
+        if not error:
+            report.sent.append(recipient)
+        elif error.status == http.HTTPStatus.FORBIDDEN:  # DM blocked by user
+            report.blocked.append(recipient)
+        else:
+            logger.error(error, exc_info=error)
+            report.failed.append(recipient)
+    logger.debug(f"Sent DMs: {report}")
+    return report
+
+
+async def update_reactions(
+    message: typing.Union[discord.Message, discord.PartialMessage],
+    add_emojis: typing.Iterable = (),
+    remove_emojis: typing.Iterable = (),
+    pin: bool = None,
+    on_progress: typing.Callable[[int, int], None] = None,
+):
+    """
+    Add and remove the reactions of the bot to a message, and pin or unpin it, with as few round trips as possible.
+    Added reactions are queued to keep their order, as are the removals of the reactions that are added back. Other
+    removals and the pin run concurrently. The first failure, if any, is raised once all operations are settled.
+    :param message: The message to update
+    :param add_emojis: The emojis to react with, in order
+    :param remove_emojis: The emojis whose reaction of the bot to remove
+    :param pin: Whether the message should be pinned (True) or unpinned (False), or left as it is (None)
+    :param on_progress: The callback called after each operation with the number of completed and total operations
+    """
+    add_emojis, remove_emojis, bot_member = list(add_emojis), list(remove_emojis), message.guild.me
+    operations_by_key = {
+        'add': [
+            functools.partial(message.remove_reaction, emoji, bot_member) for emoji in remove_emojis
+            if emoji in add_emojis  # Remove before adding back to move the reaction in last position
+        ] + [functools.partial(message.add_reaction, emoji) for emoji in add_emojis],
+        **{
+            ('remove', index): [functools.partial(message.remove_reaction, emoji, bot_member)]
+            for index, emoji in enumerate(remove_emojis) if emoji not in add_emojis
+        },
+    }
+    if pin is not None:
+        operations_by_key['pin'] = [message.pin if pin else message.unpin]
+
+    def _log_progress(_completed_count, _total_count):
+        logger.debug(f"Updated reactions of message {message.id}: {_completed_count}/{_total_count} operations.")
+        if on_progress:
+            on_progress(_completed_count, _total_count)
+
+    results_by_key = await dispatch(operations_by_key, on_progress=_log_progress)
+    for results in results_by_key.values():
+        if error := next((result for result in results if isinstance(result, discord.HTTPException)), None):
+            raise error
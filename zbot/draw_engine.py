@@ -0,0 +1,53 @@
+import heapq
+import itertools
+import math
+import random
+import typing
+
+SEED_DIGITS = 6
+
+_seed_generator = random.Random()  # Only used to pick seeds, never seeded
+
+
+class Draw:
+
+    """
+    Random draw with its own generator, isolated from the global `random` module and from concurrent draws.
+
+    Drawing again with the same seed from the same population, in the same order, gives the same result.
+    """
+
+    def __init__(self, seed: int = None):
+        self.seed = seed if seed else _seed_generator.randrange(10 ** SEED_DIGITS)
+        self.random = random.Random(self.seed)
+
+    def sample(self, population: typing.Sequence, k: int) -> list:
+        """
+        Pick k distinct elements from the population, at most all of them.
+        Indexes are sampled from a lazy range so that the population is never copied, no matter its size. The indexes
+        are the same that `random.sample` would pick from the population itself, keeping former seeds reproducible.
+        """
+        k = min(k, len(population))
+        return [population[index] for index in self.random.sample(range(len(population)), k)]
+
+    def weighted_sample(self, population: typing.Sequence, weights: typing.Iterable[float], k: int) -> list:
+        """
+        Pick k distinct elements from the population, with a probability proportional to their weight.
+        Use the reservoir-style algorithm of Efraimidis and Spirakis: each element gets the key log(u) / weight, for u
+        uniform in (0, 1], and the k largest keys win. This runs in O(n log k) in a single pass over the weights.
+        Elements with a null weight are never picked. The winners are returned in order of draw.
+        """
+        keys = (
+            (math.log(1.0 - self.random.random()) / weight, index)
+            for index, weight in enumerate(weights) if weight > 0
+        )
+        return [population[index] for _, index in heapq.nlargest(k, keys)]
+
+    def choice(self, population: typing.Sequence):
+        return self.random.choice(population)
+
+
+def split_tiers(winners: list, tier_sizes: typing.List[int]) -> typing.List[list]:
+    """Split the winners, in order of draw, into consecutive tiers of the given sizes."""
+    bounds = list(itertools.accumulate(tier_sizes, initial=0))
+    return [winners[start:end] for start, end in zip(bounds, bounds[1:])]
@@ -0,0 +1,88 @@
+import csv
+import datetime
+import io
+import json
+import tempfile
+import typing
+
+from . import converter
+
+EXPORT_FORMATS = ['csv', 'json']
+
+
+def to_bucket(time: datetime.datetime, unit: typing.Optional[str]) -> datetime.datetime or datetime.date:
+    """Localize the UTC time and truncate it to the start of its bucket, as NumPy datetime units would."""
+    localized_time = converter.to_community_tz(converter.to_utc(time)).replace(tzinfo=None)
+    if not unit:
+        return localized_time
+    elif unit == 'h':
+        return localized_time.replace(minute=0, second=0, microsecond=0)
+    elif unit == 'D':
+        return localized_time.date()
+    elif unit == 'M':
+        return localized_time.date().replace(day=1)
+    elif unit == 'Y':
+        return localized_time.date().replace(month=1, day=1)
+    raise ValueError(f"Unknown bucket unit '{unit}'.")
+
+
+def aggregate_stream(
+    records: typing.Iterable[dict], value_names: typing.List[str], unit: typing.Optional[str], key_name: str = None,
+    do_split=False
+) -> typing.Iterator[dict]:
+    """
+    Average the values of each bucket of time, one bucket at a time, as in the aggregations of the graphs.
+    Only the records of the current bucket are held in memory.
+    :param records: The records, sorted by time
+    :param value_names: The names of the fields of the records holding the values to average
+    :param key_name: The name of the field of the records holding the key (e.g. channel id) to average separately
+    :param do_split: Whether to yield a row per key, or the sum of the averages of all keys
+    :return: The rows of the aggregated series
+    """
+    def _flush(bucket, values_by_key):
+        averages_by_key = {
+            key: {value_name: round(sum(values) / len(values)) for value_name, values in key_values.items()}
+            for key, key_values in values_by_key.items()
+        }
+        if do_split:
+            for key in sorted(averages_by_key, key=str):
+                yield {'time': bucket.isoformat(), key_name: key, **averages_by_key[key]}
+        else:
+            yield {
+                'time': bucket.isoformat(),
+                **{
+                    value_name: sum(averages[value_name] for averages in averages_by_key.values())
+                    for value_name in value_names
+                }
+            }
+
+    current_bucket, values_by_key = None, {}  # {key: {value_name: [value, ...]}}
+    for record in records:
+        bucket = to_bucket(record['time'], unit)
+        if bucket != current_bucket:
+            if values_by_key:
+                yield from _flush(current_bucket, values_by_key)
+            current_bucket, values_by_key = bucket, {}
+        key_values = values_by_key.setdefault(record.get(key_name) if key_name else None, {})
+        for value_name in value_names:
+            key_values.setdefault(value_name, []).append(record[value_name])
+    if values_by_key:
+        yield from _flush(current_bucket, values_by_key)
+
+
+def write_rows(rows: typing.Iterable[dict], column_names: typing.List[str], export_format: str) -> typing.BinaryIO:
+    """Write the rows in a temporary file on disk, so that they are never all held in memory, and return it rewound."""
+    file = tempfile.TemporaryFile()
+    text_file = io.TextIOWrapper(file, encoding='utf-8', newline='', write_through=True)
+    if export_format == 'csv':
+        writer = csv.DictWriter(text_file, column_names)
+        writer.writeheader()
+        writer.writerows(rows)
+    elif export_format == 'json':
+        text_file.write('[')
+        for row_index, row in enumerate(rows):
+            text_file.write((',\n' if row_index else '\n') + json.dumps(row, ensure_ascii=False))
+        text_file.write('\n]\n')
+    text_file.detach()  # Hand the file back without closing it
+    file.seek(0)
+    return file
@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import io
+import math
+import multiprocessing
+import typing
+
+from . import importer
+
+# Imported on first render only, which happens in the worker processes
+mdates = importer.LazyModule('matplotlib.dates')
+ticker = importer.LazyModule('matplotlib.ticker')
+backend_agg = importer.LazyModule('matplotlib.backends.backend_agg')
+figure_module = importer.LazyModule('matplotlib.figure')
+RENDERING_MODULES = ['matplotlib.dates', 'matplotlib.ticker', 'matplotlib.backends.backend_agg', 'matplotlib.figure']
+
+MAX_WORKERS = 2  # Number of graphs rendered in parallel
+CACHE_MAX_BYTES = 16 * 1024 * 1024  # Maximum total size of the cached images
+FIGURE_SIZE = (6.4, 4.8)  # In inches
+FIGURE_DPI = 100
+MAX_POINTS = int(FIGURE_SIZE[0] * FIGURE_DPI)  # Points beyond one per pixel of width are not visible
+
+_executor = None  # Process pool, created on first render
+
+
+class Series(typing.NamedTuple):
+    times: list
+    counts: list
+    label: str = None
+    secondary: bool = False  # Whether to plot the series on the secondary count axis, on the right
+
+
+def render(
+    series_list: typing.List[Series], days_number: int, time_limit: datetime.datetime, today: datetime.datetime,
+    count_name: str, granularity: str, secondary_count_name: str = None
+) -> bytes:
+    """
+    Render a graph of counts over time into PNG bytes.
+    Each call draws on its own figure through the object-oriented API, so that renders don't share any global state and
+    can run in worker processes.
+    :param secondary_count_name: The name of the counts of the secondary series, if any
+    """
+    figure = figure_module.Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    backend_agg.FigureCanvasAgg(figure)  # Attach the Agg canvas to the figure
+    axes = figure.add_subplot()
+    secondary_axes = axes.twinx() if any(series.secondary for series in series_list) else None
+    lines = []
+    for series_index, series in enumerate(series_list):
+        lines += (secondary_axes if series.secondary else axes).plot(
+            series.times, series.counts, label=series.label, linestyle='-', marker='.', alpha=0.75,
+            color=f'C{series_index}'  # Don't restart the color cycle on the secondary axes
+        )
+    if any(series.label for series in series_list):
+        axes.legend(handles=lines)
+    all_counts = [count for series in series_list if not series.secondary for count in series.counts] or [0]
+    configure_axes(axes, days_number, time_limit, today, min(all_counts), max(all_counts), count_name, granularity)
+    if secondary_axes:
+        all_secondary_counts = [
+            count for series in series_list if series.secondary for count in series.counts
+        ] or [0]
+        configure_count_axis(secondary_axes, min(all_secondary_counts), max(all_secondary_counts))
+        secondary_axes.set_ylabel(secondary_count_name)
+
+    buffer = io.BytesIO()  # Instantiate I/O buffer
+    figure.savefig(buffer, format='png')  # Plot the graph and save it in the buffer
+    return buffer.getvalue()
+
+
+def configure_axes(axes, days_number, time_limit, today, min_count, max_count, count_name, granularity):
+    # Set labels
+    axes.set_xlabel("Temps")
+    axes.set_ylabel(count_name)
+    years_number = today.year - time_limit.year
+    months_number = years_number * 12 + (today.month - time_limit.month)
+    if granularity == 'hour':
+        axes.set_title(f"{count_name} sur les {days_number * 24} dernières heures")
+    elif granularity == 'day':
+        axes.set_title(f"{count_name} sur les {days_number} derniers jours")
+    elif granularity == 'month':
+        axes.set_title(f"{count_name} sur les {months_number} derniers mois")
+    elif granularity == 'year':
+        axes.set_title(f"{count_name} sur les {years_number} dernières années")
+
+    # Format time axis to comply with granularity
+    if granularity == 'hour':
+        axes.set_xlim(left=time_limit.replace(tzinfo=None), right=today.replace(tzinfo=None))  # Make tz agnostic
+        axes.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m %H:%M'))
+        axes.xaxis.set_major_locator(ticker.MaxNLocator(nbins=5))
+    else:
+        axes.set_xlim(left=time_limit, right=today)
+        if granularity == 'day':
+            axes.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
+        elif granularity in ('month', 'year'):
+            axes.xaxis.set_major_formatter(mdates.DateFormatter('%m/%y'))
+        axes.xaxis.set_major_locator(ticker.MaxNLocator(nbins=min(10, days_number)))
+
+    configure_count_axis(axes, min_count, max_count)
+
+
+def configure_count_axis(axes, min_count, max_count):
+    # Format count axis to show integers only, on 5 to 10 ticks
+    counts_range = max_count - min_count + 1
+    if counts_range < 10:  # Force the positioning of counts in the middle of the range
+        half_gap = (10 - counts_range) / 2
+        axes.set_ylim(bottom=min_count - math.floor(half_gap), top=max_count + math.ceil(half_gap))
+    axes.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _pos: str(int(y))))
+    axes.yaxis.set_major_locator(ticker.MaxNLocator(nbins=10))
+
+
+class RenderCache:
+
+    """LRU cache of rendered graphs, bounded by the total size of the images."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._images = collections.OrderedDict()  # {key: png_bytes}, least recently used first
+        self._size = 0
+
+    def get(self, key: typing.Hashable) -> bytes or None:
+        if (image := self._images.get(key)) is not None:
+            self._images.move_to_end(key)
+        return image
+
+    def put(self, key: typing.Hashable, image: bytes):
+        if len(image) > self.max_bytes:
+            return  # Would evict every other image
+        if key in self._images:
+            self._size -= len(self._images.pop(key))
+        self._images[key] = image
+        self._size += len(image)
+        while self._size > self.max_bytes:
+            _, evicted_image = self._images.popitem(last=False)
+            self._size -= len(evicted_image)
+
+
+def get_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _executor
+    if not _executor:
+        # Don't fork the bot process, whose threads (e.g. import warm-up) may hold locks the workers would inherit
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])  # Only what renders need, instead of the whole bot in __main__
+        else:  # Windows
+            context = multiprocessing.get_context('spawn')
+        _executor = concurrent.futures.ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=context)
+    return _executor
+
+
+async def render_async(*args) -> bytes:
+    """Render the graph in a worker process to keep the event loop responsive."""
+    return await asyncio.get_event_loop().run_in_executor(get_executor(), render, *args)
+
+
+def import_rendering_modules():
+    for module_name in RENDERING_MODULES:
+        importer.load(module_name)
+
+
+def warm_up():
+    """Start the worker processes and import matplotlib in them ahead of the first render."""
+    executor = get_executor()
+    for _ in range(MAX_WORKERS):
+        executor.submit(import_rendering_modules)
@@ -0,0 +1,58 @@
+import typing
+
+import discord
+
+from . import logger
+
+
+class GuildStatsCache:
+
+    """
+    Counts of members per role and of banned users of a guild, kept current by the member events.
+
+    The counts are fully recomputed on refresh, which is the only operation requiring a call to the API. In between,
+    events that were missed (e.g. during a reconnection) or roles that were renamed can make them drift slightly.
+    """
+
+    def __init__(self, guild: discord.Guild, role_names: typing.List[str]):
+        self.guild = guild
+        self.role_names = role_names
+        self.role_sizes = {}  # {role_id: member_count}
+        self.role_ids = {}  # {role_name: role_id}
+        self.ban_count = None  # Unknown until the first refresh
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.ban_count is not None
+
+    async def refresh(self):
+        self.role_ids = {
+            role.name: role.id for role in self.guild.roles if role.name in self.role_names
+        }
+        self.role_sizes = dict.fromkeys(self.role_ids.values(), 0)
+        for member in self.guild.members:  # Single pass over the members instead of one per role
+            self.count_member(member, 1)
+        self.ban_count = len(await self.guild.bans())
+        logger.debug(f"Refreshed guild stats: {self.get_role_sizes()} and {self.ban_count} ban(s).")
+
+    def get_role_sizes(self) -> typing.Dict[str, int]:
+        """Return the number of members of each tracked role, indexed by role name."""
+        return {role_name: self.role_sizes.get(role_id, 0) for role_name, role_id in self.role_ids.items()}
+
+    def count_member(self, member: discord.Member, increment: int):
+        self.count_roles(member.roles, increment)
+
+    def count_roles(self, roles: typing.Iterable[discord.Role], increment: int):
+        for role in roles:
+            if role.id in self.role_sizes:
+                self.role_sizes[role.id] = max(self.role_sizes[role.id] + increment, 0)
+
+    def update_member(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            before_roles, after_roles = set(before.roles), set(after.roles)
+            self.count_roles(before_roles - after_roles, -1)
+            self.count_roles(after_roles - before_roles, 1)
+
+    def count_ban(self, increment: int):
+        if self.ban_count is not None:
+            self.ban_count = max(self.ban_count + increment, 0)
@@ -0,0 +1,47 @@
+import hashlib
+import math
+
+DEFAULT_PRECISION = 10  # 2^10 registers of one byte, for a standard error of about 3%
+HASH_BITS = 64
+
+
+class HyperLogLog:
+
+    """
+    Sketch estimating the number of distinct values added to it, in a constant memory of 2^precision bytes.
+
+    Each value is hashed; the first bits of the hash select a register, which keeps the highest position of the first
+    set bit seen in the remaining bits. Sketches of the same precision can be merged to count the union of their values.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers: bytes = None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers else bytearray(1 << precision)
+
+    def add(self, value: int):
+        hash_value = int.from_bytes(
+            hashlib.blake2b(value.to_bytes(8, 'little', signed=True), digest_size=HASH_BITS // 8).digest(), 'little'
+        )
+        register_index = hash_value >> (HASH_BITS - self.precision)
+        remaining_bits = hash_value & ((1 << (HASH_BITS - self.precision)) - 1)
+        rank = HASH_BITS - self.precision - remaining_bits.bit_length() + 1  # Position of the first set bit
+        if rank > self.registers[register_index]:
+            self.registers[register_index] = rank
+
+    def count(self) -> int:
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count ** 2 / sum(2.0 ** -register for register in self.registers)
+        if estimate <= 2.5 * register_count and (empty_register_count := self.registers.count(0)):
+            # Small cardinality, use linear counting instead
+            estimate = register_count * math.log(register_count / empty_register_count)
+        return round(estimate)
+
+    def merge(self, other: 'HyperLogLog'):
+        """Add the values of the other sketch to this one."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {other.precision} and {self.precision}.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
@@ -0,0 +1,54 @@
+import importlib
+import sys
+import threading
+import typing
+from time import perf_counter
+
+from . import logger
+
+import_times = {}  # {module_name: seconds}, for the modules imported through this module
+
+
+class LazyModule:
+
+    """Proxy of a module that is only imported when one of its attributes is first accessed."""
+
+    def __init__(self, module_name: str):
+        self._module_name = module_name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = load(self._module_name)
+        return getattr(self._module, attribute)
+
+
+def load(module_name: str):
+    """Import the module if it is not yet, and record the time it took."""
+    if module := sys.modules.get(module_name):
+        return module
+    start_time = perf_counter()
+    module = importlib.import_module(module_name)
+    import_times[module_name] = perf_counter() - start_time
+    logger.debug(f"Imported module '{module_name}' in {import_times[module_name]:.3f}s.")
+    return module
+
+
+def warm_up(module_names: typing.Iterable[str]):
+    """Import the modules in a background thread, so that the first commands using them don't pay for the import."""
+    def _warm_up():
+        for module_name in module_names:
+            try:
+                load(module_name)
+            except ImportError:
+                logger.error(f"Could not import module '{module_name}'.", exc_info=True)
+        report()
+
+    threading.Thread(target=_warm_up, name='warm-up', daemon=True).start()
+
+
+def report():
+    logger.info(
+        f"Imported {len(import_times)} module(s) lazily in {sum(import_times.values()):.3f}s: "
+        + ", ".join(f"'{module_name}' ({seconds:.3f}s)" for module_name, seconds in import_times.items())
+    )
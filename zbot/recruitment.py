@@ -0,0 +1,182 @@
+import asyncio
+import datetime
+import typing
+
+import discord
+
+from zbot import zbot
+from . import logger
+
+RECHECK_LIMIT = 100  # Number of most recent messages checked at startup for deletions made while the bot was offline
+
+
+class MirroredAuthor(typing.NamedTuple):
+
+    """Stand-in for the author of an announce who is no longer a member of the server."""
+
+    id: int
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+class MirroredAnnounce:
+
+    """Copy of a message of the recruitment channel, exposing the attributes of discord.Message used by the checks."""
+
+    def __init__(self, mirror: 'RecruitmentMirror', announce_data: dict):
+        self.mirror = mirror
+        self.channel = mirror.channel
+        self.id = announce_data['_id']
+        self.author_id = announce_data['author']
+        self.created_at = announce_data['time']  # Naive UTC time, as for discord.Message
+        self.content = announce_data['content']
+        self.embeds = [discord.Embed.from_dict(embed_data) for embed_data in announce_data['embeds']]
+        self.pinned = announce_data['pinned']
+        self.type = discord.MessageType[announce_data['type']]
+
+    @property
+    def author(self) -> discord.Member or MirroredAuthor:
+        return self.channel.guild.get_member(self.author_id) or MirroredAuthor(self.author_id)
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.channel.guild.id}/{self.channel.id}/{self.id}"
+
+    async def fetch_author(self) -> discord.abc.User or MirroredAuthor:
+        """Return the author as a member, or as a user if they left the server, e.g. to send them DMs."""
+        if author := self.channel.guild.get_member(self.author_id) or zbot.bot.get_user(self.author_id):
+            return author
+        try:
+            return await zbot.bot.fetch_user(self.author_id)
+        except discord.NotFound:  # Deleted account
+            return MirroredAuthor(self.author_id)
+
+    async def delete(self):
+        try:
+            await self.channel.get_partial_message(self.id).delete()
+        except discord.NotFound:  # Already deleted while the bot was offline, so no deletion event will clear it
+            self.mirror.remove(self.id)
+
+
+class RecruitmentMirror:
+
+    """
+    Copy of the messages of the recruitment channel, kept in memory and in the database.
+
+    At startup, only the messages posted after the last mirrored one are fetched, and the most recent messages are
+    fetched again to drop those deleted while the bot was offline. The mirror is then kept current by the message
+    events, so that reading the channel requires no call to the API. Older messages deleted while the bot was offline,
+    and messages edited meanwhile, are not caught up with until cleared from the database.
+    """
+
+    def __init__(self, db):
+        """:param db: The database connector to persist the mirror with"""
+        self.db = db
+        self.channel = None
+        self._announces = {}  # {message_id: mirrored_announce}
+        self._sync_task = None
+
+    def start(self, channel: discord.TextChannel):
+        """Start the synchronization of the mirror with the channel."""
+        if not channel:
+            logger.error("Could not find the recruitment channel, the recruitment mirror is unavailable.")
+            return
+        self.channel = channel
+        self._sync_task = asyncio.get_event_loop().create_task(self.sync())
+
+    async def sync(self):
+        for announce_data in self.db.load_recruitment_mirror():
+            self._announces[announce_data['_id']] = MirroredAnnounce(self, announce_data)
+        last_message = discord.Object(max(self._announces)) if self._announces else None
+        new_messages = await self.channel.history(limit=None, after=last_message, oldest_first=True).flatten()
+        self.record(*new_messages)
+
+        # Drop the mirrored messages missing from the range of the most recent ones, newest first
+        recent_messages = await self.channel.history(limit=RECHECK_LIMIT).flatten()
+        recent_message_ids = {message.id for message in recent_messages}
+        oldest_rechecked_id = recent_messages[-1].id if len(recent_messages) == RECHECK_LIMIT else 0
+        newest_rechecked_id = recent_messages[0].id if recent_messages else 0  # Don't drop messages posted since then
+        deleted_message_ids = [
+            message_id for message_id in self._announces
+            if oldest_rechecked_id <= message_id <= newest_rechecked_id and message_id not in recent_message_ids
+        ] if recent_messages else list(self._announces)  # Empty channel
+        self.remove(*deleted_message_ids)
+        logger.debug(
+            f"Synchronized recruitment mirror with {len(new_messages)} new message(s) "
+            f"and {len(deleted_message_ids)} deleted message(s)."
+        )
+
+    async def get_announces(self, after: datetime.datetime = None) -> typing.List[MirroredAnnounce]:
+        """
+        Return the mirrored messages of the channel, newest first.
+        :param after: The naive UTC time after which the messages must have been posted
+        """
+        await self.wait_for_sync()
+        return [
+            self._announces[message_id] for message_id in sorted(self._announces, reverse=True)
+            if not after or self._announces[message_id].created_at > after
+        ]
+
+    async def get_announce(self, message_id: int) -> MirroredAnnounce or None:
+        await self.wait_for_sync()
+        return self._announces.get(message_id)
+
+    async def wait_for_sync(self):
+        """Wait for the startup synchronization if still in progress, and restart it if it failed."""
+        if not self._sync_task:  # Not started, e.g. because the channel could not be found
+            raise RuntimeError("The recruitment mirror is unavailable, as the recruitment channel could not be found.")
+        sync_task = self._sync_task
+        try:
+            await sync_task
+        except Exception:  # Any failure, e.g. of the API or of the database, must not stick until the next restart
+            if self._sync_task is sync_task:  # Not yet restarted by another command
+                logger.error("Could not synchronize the recruitment mirror, retrying.", exc_info=True)
+                self._sync_task = asyncio.get_event_loop().create_task(self.sync())
+            await self._sync_task
+
+    def record(self, *messages: discord.Message):
+        if not messages:
+            return
+        announces_data = [self.to_announce_data(message) for message in messages]
+        self.db.update_recruitment_mirror(announces_data)
+        self.db.update_recruitment_announces(messages)  # Keep the log of the announces for the timespan checks
+        for announce_data in announces_data:
+            self._announces[announce_data['_id']] = MirroredAnnounce(self, announce_data)
+
+    def update(self, message_id: int, message_data: dict):
+        """Apply the fields of a raw message update to the mirrored message, if any."""
+        if not (announce := self._announces.get(message_id)):
+            return
+        announce_data = {
+            key: value for key, value in (
+                ('content', message_data.get('content')),
+                ('embeds', message_data.get('embeds')),
+                ('pinned', message_data.get('pinned')),
+            ) if value is not None  # Fields missing from partial updates are unchanged
+        }
+        if announce_data:
+            self.db.update_recruitment_mirror([{'_id': message_id, **announce_data}])
+            announce.content = announce_data.get('content', announce.content)
+            announce.pinned = announce_data.get('pinned', announce.pinned)
+            if 'embeds' in announce_data:
+                announce.embeds = [discord.Embed.from_dict(embed_data) for embed_data in announce_data['embeds']]
+
+    def remove(self, *message_ids: int):
+        if message_ids := [message_id for message_id in message_ids if message_id in self._announces]:
+            self.db.delete_recruitment_mirror(message_ids)
+            for message_id in message_ids:
+                del self._announces[message_id]
+
+    @staticmethod
+    def to_announce_data(message: discord.Message) -> dict:
+        return {
+            '_id': message.id,
+            'author': message.author.id,
+            'time': message.created_at,
+            'content': message.content,
+            'embeds': [embed.to_dict() for embed in message.embeds],
+            'pinned': message.pinned,
+            'type': message.type.name,
+        }
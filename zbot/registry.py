@@ -0,0 +1,122 @@
+import heapq
+
+from . import tally
+
+
+class PendingJobRegistry:
+
+    """
+    Local cache of pending job data (lotteries, polls, ...) indexed both by message id and by public id.
+
+    The message id is used to match reactions with a pending job while the public id is the one displayed to users and
+    provided as argument of commands. Each write to the registry is forwarded to the persistence hook.
+    Public ids are stable: the id of a removed job is put on a free-list and reused, smallest first, by the next job.
+    If the jobs have options to react with, the registry also keeps a vote tally of each job, persisted on flush.
+    """
+
+    TALLY_KEY = 'tally'
+
+    def __init__(self, public_id_key: str, update_job_data, get_option_codes=None):
+        """
+        :param public_id_key: The key of the public id in the job data (e.g. 'lottery_id')
+        :param update_job_data: The persistence hook, called as `update_job_data(job_id, job_data)`
+        :param get_option_codes: The getter of the option codes from the job data, if votes are tallied
+        """
+        self.public_id_key = public_id_key
+        self.update_job_data = update_job_data
+        self.get_option_codes = get_option_codes
+        self._tallies = {}  # {message_id: vote_tally}
+        self._jobs_data = {}  # {message_id: job_data}
+        self._message_ids = {}  # {public_id: message_id}
+        self._max_public_id = 0
+        self._free_public_ids = []  # Min-heap of the unused ids below the max public id
+
+    def load(self, pending_jobs_data: dict):
+        """Replace the content of the registry by the pending jobs data indexed by message id."""
+        self._jobs_data.clear()
+        self._message_ids.clear()
+        self._tallies.clear()
+        self._max_public_id = 0
+        for message_id, job_data in pending_jobs_data.items():
+            self._index(message_id, job_data)
+        self._free_public_ids = [
+            public_id for public_id in range(1, self._max_public_id) if public_id not in self._message_ids
+        ]  # Sorted list, thus already a heap
+
+    def _index(self, message_id, job_data):
+        public_id = job_data[self.public_id_key]
+        self._jobs_data[message_id] = job_data
+        self._message_ids[public_id] = message_id
+        if self.get_option_codes:
+            self._tallies[message_id] = tally.VoteTally.from_data(
+                self.get_option_codes(job_data), job_data.pop(self.TALLY_KEY, None)
+            )
+        if self._free_public_ids and self._free_public_ids[0] == public_id:
+            heapq.heappop(self._free_public_ids)
+        self._max_public_id = max(self._max_public_id, public_id)
+
+    def __contains__(self, message_id) -> bool:
+        return message_id in self._jobs_data
+
+    def __getitem__(self, message_id) -> dict:
+        return self._jobs_data[message_id]
+
+    def __len__(self) -> int:
+        return len(self._jobs_data)
+
+    def items(self):
+        return self._jobs_data.items()
+
+    def values(self):
+        return self._jobs_data.values()
+
+    def get_by_public_id(self, public_id: int) -> dict or None:
+        if (message_id := self._message_ids.get(public_id)) is not None:
+            return self._jobs_data[message_id]
+        return None
+
+    def get_tally(self, message_id) -> tally.VoteTally:
+        return self._tallies[message_id]
+
+    def flush_tallies(self):
+        """Persist the vote tallies that changed since the last flush."""
+        for message_id, vote_tally in self._tallies.items():
+            if vote_tally.is_dirty:
+                self.update_job_data(self._jobs_data[message_id]['_id'], {self.TALLY_KEY: vote_tally.to_data()})
+                vote_tally.is_dirty = False
+
+    def get_next_public_id(self) -> int:
+        if self._free_public_ids and self._free_public_ids[0] > self._max_public_id:
+            self._free_public_ids.clear()  # Only stale ids are left after the id range shrank
+        return self._free_public_ids[0] if self._free_public_ids else self._max_public_id + 1
+
+    def add(self, job_id, job_data: dict, scheduler_data: dict = None):
+        """
+        Persist the data of a new job and register it.
+        :param job_id: The id of the job in the job store
+        :param job_data: The data of the job, public id and message id included
+        :param scheduler_data: The data managed by the scheduler, only kept in cache
+        """
+        self.update_job_data(job_id, job_data)
+        # Add data managed by scheduler later to avoid updating the database with them
+        self._index(job_data['message_id'], {**job_data, **(scheduler_data or {}), '_id': job_id})
+
+    def update(self, message_id, job_data: dict, persist=True):
+        """Update the data of a registered job, and persist it unless it is managed by the scheduler."""
+        if persist:
+            self.update_job_data(self._jobs_data[message_id]['_id'], job_data)
+        self._jobs_data[message_id].update(job_data)
+
+    def remove(self, message_id) -> dict:
+        """Unregister a job and release its public id without renumbering the other jobs."""
+        job_data = self._jobs_data.pop(message_id)
+        self._tallies.pop(message_id, None)
+        removed_public_id = job_data[self.public_id_key]
+        del self._message_ids[removed_public_id]
+        if removed_public_id < self._max_public_id:
+            heapq.heappush(self._free_public_ids, removed_public_id)
+        else:  # Shrink the id range rather than growing the free-list, trailing free ids become stale
+            self._max_public_id = next(
+                (public_id for public_id in range(removed_public_id - 1, 0, -1) if public_id in self._message_ids), 0
+            )
+        return job_data
@@ -0,0 +1,96 @@
+import typing
+
+OptionCode = typing.Union[str, int]  # Unicode string or custom emoji id
+
+
+class VoteTally:
+
+    """
+    Live record of the voters of each option of a pending job, kept in sync with the reactions of its message.
+
+    The tally mirrors the reactions: votes rejected by the checks are still recorded until their reaction is removed.
+    Validity of the votes is only assessed when counting them.
+    """
+
+    def __init__(self, option_codes: typing.Iterable[OptionCode]):
+        self.voters = {option_code: set() for option_code in option_codes}  # {option_code: {voter_id, ...}}
+        self.options_by_voter = {}  # {voter_id: {option_code, ...}}, reverse index of the voters
+        self.is_dirty = False  # Whether the tally changed since it was last persisted
+
+    def add_vote(self, option_code: OptionCode, voter_id: int) -> bool:
+        """Record a vote and return True if the option is part of the tally, False otherwise."""
+        if option_code not in self.voters:
+            return False
+        self.voters[option_code].add(voter_id)
+        self.options_by_voter.setdefault(voter_id, set()).add(option_code)
+        self.is_dirty = True
+        return True
+
+    def remove_vote(self, option_code: OptionCode, voter_id: int) -> bool:
+        """Discard a vote and return True if the option is part of the tally, False otherwise."""
+        if option_code not in self.voters:
+            return False
+        self.voters[option_code].discard(voter_id)
+        self._discard_voter_option(voter_id, option_code)
+        self.is_dirty = True
+        return True
+
+    def _discard_voter_option(self, voter_id: int, option_code: OptionCode):
+        if voter_option_codes := self.options_by_voter.get(voter_id):
+            voter_option_codes.discard(option_code)
+            if not voter_option_codes:
+                del self.options_by_voter[voter_id]
+
+    def set_voters(self, option_code: OptionCode, voter_ids: typing.Iterable[int]):
+        """Overwrite the voters of an option."""
+        if option_code in self.voters:
+            previous_voter_ids, voter_ids = self.voters[option_code], set(voter_ids)
+            for voter_id in previous_voter_ids - voter_ids:
+                self._discard_voter_option(voter_id, option_code)
+            for voter_id in voter_ids - previous_voter_ids:
+                self.options_by_voter.setdefault(voter_id, set()).add(option_code)
+            self.voters[option_code] = voter_ids
+            self.is_dirty = True
+
+    def set_options(self, option_codes: typing.Iterable[OptionCode]):
+        """Replace the options of the tally while keeping the voters of the options that are retained."""
+        option_codes = list(option_codes)
+        for removed_option_code in set(self.voters) - set(option_codes):
+            self.set_voters(removed_option_code, [])
+        self.voters = {option_code: self.voters.get(option_code, set()) for option_code in option_codes}
+        self.is_dirty = True
+
+    def get_voter_options(self, voter_id: int) -> typing.Set[OptionCode]:
+        """Return the options the voter has voted for."""
+        return self.options_by_voter.get(voter_id, set())
+
+    def count(self, is_exclusive: bool, is_valid_voter: typing.Callable[[int], bool]) -> dict:
+        """
+        Count the valid votes of each option.
+        :param is_exclusive: Whether only the votes of voters having voted once are counted
+        :param is_valid_voter: The predicate filtering out voters that are bots or lack the required role
+        :return: The number of valid votes of each option, in the order of the options
+        """
+        # Assess each voter once, no matter how many options they voted for
+        # In exclusive mode, only count vote of voters having voted once
+        valid_voter_ids = {
+            voter_id for voter_id, voter_option_codes in self.options_by_voter.items()
+            if (not is_exclusive or len(voter_option_codes) == 1) and is_valid_voter(voter_id)
+        }
+        return {option_code: len(voter_ids & valid_voter_ids) for option_code, voter_ids in self.voters.items()}
+
+    def to_data(self) -> list:
+        """Serialize the tally into a list of documents, as custom emoji ids can't be used as keys in MongoDB."""
+        return [
+            {'option_code': option_code, 'voter_ids': list(voter_ids)}
+            for option_code, voter_ids in self.voters.items()
+        ]
+
+    @staticmethod
+    def from_data(option_codes: typing.Iterable[OptionCode], tally_data: list = None) -> 'VoteTally':
+        """Deserialize the tally, ignoring the recorded options that are no longer part of the job."""
+        vote_tally = VoteTally(option_codes)
+        for option_data in tally_data or []:
+            vote_tally.set_voters(option_data['option_code'], option_data['voter_ids'])
+        vote_tally.is_dirty = False
+        return vote_tally
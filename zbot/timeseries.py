@@ -0,0 +1,123 @@
+import datetime
+import typing
+
+import numpy as np
+
+# Bucket units of the aggregations, as NumPy datetime units
+HOUR_UNIT, DAY_UNIT, MONTH_UNIT, YEAR_UNIT = 'h', 'D', 'M', 'Y'
+
+
+def to_datetime64(utc_times: typing.Iterable[datetime.datetime]) -> np.ndarray:
+    """Convert naive UTC datetimes, as returned by MongoDB, into an array of datetime64."""
+    return np.array(list(utc_times), dtype='datetime64[s]')
+
+
+def localize(utc_times: np.ndarray, timezone: datetime.tzinfo) -> np.ndarray:
+    """
+    Convert an array of UTC times into naive local times of the timezone.
+    The UTC offset of each time is looked up in the table of transitions of the pytz timezone, for the whole array at
+    once, instead of localizing the times one by one.
+    """
+    if transition_times := getattr(timezone, '_utc_transition_times', None):
+        transition_times = np.array(transition_times, dtype='datetime64[s]')
+        offsets = np.array([int(utc_offset.total_seconds()) for utc_offset, _, _ in timezone._transition_info])
+        transition_indices = np.maximum(np.searchsorted(transition_times, utc_times, side='right') - 1, 0)
+        return utc_times + offsets[transition_indices].astype('timedelta64[s]')
+    # Timezone with a fixed offset
+    return utc_times + np.timedelta64(int(timezone.utcoffset(datetime.datetime.utcnow()).total_seconds()), 's')
+
+
+def to_buckets(times: np.ndarray, unit: typing.Optional[str]) -> np.ndarray:
+    """Truncate the times to the start of their bucket, or keep them as they are if no unit is provided."""
+    return times.astype(f'datetime64[{unit}]') if unit else times
+
+
+def aggregate(times: np.ndarray, values: np.ndarray, unit: typing.Optional[str]) -> (np.ndarray, np.ndarray):
+    """
+    Average the values of each bucket of time.
+    :param times: The times of the samples, in any order
+    :param values: The values of the samples
+    :param unit: The unit of the buckets, or None to average the samples sharing the exact same time
+    :return: The sorted buckets and the rounded average value of each bucket
+    """
+    _, buckets, averages = aggregate_by_key(times, values, np.zeros(len(times), dtype=np.int64), unit)
+    return buckets, averages
+
+
+def aggregate_by_key(
+    times: np.ndarray, values: np.ndarray, keys: np.ndarray, unit: typing.Optional[str]
+) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Average the values of each bucket of time, separately for each key (e.g. channel id), in a single pass.
+    :return: The key, the bucket and the rounded average value of each group, sorted by key then by bucket
+    """
+    if not len(times):
+        return keys[:0], to_buckets(times, unit), np.zeros(0, dtype=np.int64)
+    buckets = to_buckets(times, unit)
+    order = np.lexsort((buckets, keys))  # Sort by key, then by bucket
+    sorted_keys, sorted_buckets, sorted_values = keys[order], buckets[order], np.asarray(values)[order]
+    group_starts = np.flatnonzero(np.concatenate((
+        [True], (sorted_keys[1:] != sorted_keys[:-1]) | (sorted_buckets[1:] != sorted_buckets[:-1])
+    )))
+    sums = np.add.reduceat(sorted_values, group_starts)
+    sizes = np.diff(np.append(group_starts, len(sorted_values)))
+    averages = np.rint(sums / sizes).astype(np.int64)
+    return sorted_keys[group_starts], sorted_buckets[group_starts], averages
+
+
+def sum_aligned(group_keys: np.ndarray, group_buckets: np.ndarray, averages: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Sum the averages of all keys for each bucket, aligning the buckets across keys.
+    Buckets where a key has no sample count as zero for this key, instead of shifting its following samples.
+    """
+    buckets, bucket_indices = np.unique(group_buckets, return_inverse=True)
+    totals = np.zeros(len(buckets), dtype=np.int64)
+    np.add.at(totals, bucket_indices, averages)
+    return buckets, totals
+
+
+def split_by_key(
+    group_keys: np.ndarray, group_buckets: np.ndarray, averages: np.ndarray
+) -> typing.Dict[typing.Any, typing.Tuple[np.ndarray, np.ndarray]]:
+    """Split the aggregated groups into a series of buckets and averages per key."""
+    if not len(group_keys):
+        return {}
+    key_starts = np.flatnonzero(np.concatenate(([True], group_keys[1:] != group_keys[:-1])))
+    key_ends = np.append(key_starts[1:], len(group_keys))
+    return {
+        group_keys[start].item(): (group_buckets[start:end], averages[start:end])
+        for start, end in zip(key_starts, key_ends)
+    }
+
+
+def downsample_lttb(times: np.ndarray, values: np.ndarray, threshold: int) -> (np.ndarray, np.ndarray):
+    """
+    Reduce the series to a number of points with the Largest-Triangle-Three-Buckets algorithm.
+    The first and last points are kept, and the points in between are split into buckets from which only the point
+    forming the largest triangle with the previously kept point and the average of the next bucket is kept. This
+    preserves the peaks and the overall shape of the series.
+    :param times: The sorted times of the series
+    :param values: The values of the series
+    :param threshold: The maximum number of points to keep
+    :return: The times and the values of the kept points
+    """
+    point_count = len(times)
+    if threshold < 3 or point_count <= threshold:
+        return times, values
+    xs, ys = times.astype(np.int64).astype(np.float64), values.astype(np.float64)
+    bucket_edges = np.linspace(1, point_count - 1, threshold - 1).astype(np.int64)  # Edges of threshold - 2 buckets
+    kept_indices = np.empty(threshold, dtype=np.int64)
+    kept_indices[0], kept_indices[-1] = 0, point_count - 1
+    previous_index = 0
+    for bucket_index in range(threshold - 2):
+        start, end = bucket_edges[bucket_index], bucket_edges[bucket_index + 1]
+        # The next bucket of the last one is the last point
+        next_start, next_end = (end, bucket_edges[bucket_index + 2]) if bucket_index < threshold - 3 \
+            else (point_count - 1, point_count)
+        next_x, next_y = xs[next_start:next_end].mean(), ys[next_start:next_end].mean()
+        previous_x, previous_y = xs[previous_index], ys[previous_index]
+        areas = np.abs(
+            (previous_x - next_x) * (ys[start:end] - previous_y) - (previous_x - xs[start:end]) * (next_y - previous_y)
+        )
+        previous_index = kept_indices[bucket_index + 1] = start + np.argmax(areas)
+    return times[kept_indices], values[kept_indices]
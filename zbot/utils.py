@@ -8,6 +8,7 @@ import discord
 from discord.ext import commands
 
 from . import converter
+from . import dispatcher
 from . import exceptions
 from . import logger
 
@@ -80,21 +81,34 @@ def make_user_list(users: typing.List[discord.User], mention=True, separator=",
     ])
 
 
-def make_message_blocks(messages: [str], separator: str = "\n"):
+def make_message_blocks(messages: [str], separator: str = "\n", max_length: int = MAX_MESSAGE_LENGTH):
     """Join a list of messages by a separator in a block. Split the block if it is too long."""
     blocks, block = [], ""
     for index, message in enumerate(messages):
-        if len(block) + len(message) + len(separator) <= MAX_MESSAGE_LENGTH:
+        if len(block) + len(message) + len(separator) <= max_length:
             block += message + (separator if index < len(messages) - 1 else "")
-        elif len(message) + len(separator) <= MAX_MESSAGE_LENGTH:
+        elif len(message) + len(separator) <= max_length:
             blocks.append(block)
-            block = ""
+            block = message + (separator if index < len(messages) - 1 else "")  # Start next block with the message
         else:
             raise ValueError("message is longer than maximum message length")
     blocks.append(block)
     return blocks
 
 
+def split_message(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> [str]:
+    """Split a message into chunks no longer than the maximum length, at the last line break of each chunk if any."""
+    chunks = []
+    while len(message) > max_length:
+        split_index = message.rfind("\n", 0, max_length + 1)
+        if split_index <= 0:  # No line break to split at, cut the line
+            split_index = max_length
+        chunks.append(message[:split_index])
+        message = message[split_index:].lstrip("\n")
+    chunks.append(message)
+    return chunks
+
+
 def make_announce(guild, announce: str, announce_role_name: str = None) -> str:
     """Prefix the announce with the mention of the announce role, if any."""
     if announce_role_name:
@@ -140,6 +154,13 @@ def try_get_emoji(
                 raise error
 
 
+def get_emoji_code(emoji: typing.Union[str, discord.Emoji, discord.PartialEmoji]) -> typing.Union[str, int]:
+    """Return the code of an emoji: the unicode string for unicode emojis, the id for custom emojis."""
+    if isinstance(emoji, str):
+        return emoji
+    return emoji.id or emoji.name  # Unicode partial emojis have no id
+
+
 async def try_get_message(
     channel: discord.TextChannel, message_id: int, error: commands.CommandError = None
 ) -> discord.Message:
@@ -167,10 +188,8 @@ async def try_dm(user: discord.User, message: str) -> bool:
 
 async def try_dms(user: discord.User, messages: typing.List[str], group_in_blocks: bool) -> bool:
     """Attempt to dm a list of messages to a user and return True if it was successful, False otherwise."""
-    result = True
-    for content in (make_message_blocks(messages) if group_in_blocks else messages):
-        result &= await try_dm(user, content)
-    return result
+    report = await dispatcher.send_dms({user: make_message_blocks(messages) if group_in_blocks else messages})
+    return user in report.sent
 
 
 # Parsers
@@ -1,4 +1,5 @@
 import os
+from time import perf_counter
 
 import discord
 import dotenv
@@ -10,6 +11,8 @@ from discord.ext.commands import NoEntryPointError
 
 from . import database
 from . import error_handler
+from . import graph
+from . import importer
 from . import logger
 from . import scheduler
 
@@ -28,6 +31,7 @@ COGS = [
     'zbot.cogs.special',
     'zbot.cogs.stats',
 ]
+LAZY_MODULES = ['dateutil.parser', 'emojis']  # Imported in the background once ready
 
 
 def get_prefix(client, message):
@@ -52,12 +56,15 @@ async def on_ready():
     db.open_connection()
     for cog in COGS:
         try:
+            start_time = perf_counter()
             bot.load_extension(cog)
-            logger.info(f"Loaded extension '{cog.split('.')[-1]}'.")
+            logger.info(f"Loaded extension '{cog.split('.')[-1]}' in {perf_counter() - start_time:.3f}s.")
         except (ExtensionNotFound, ExtensionAlreadyLoaded, NoEntryPointError, ExtensionFailed):
             logger.error(f"Failed to loaded extension '{cog.split('.')[-1]}'.", exc_info=True)
     scheduler.setup(db)
     await bot.change_presence(activity=discord.Game(name="Commandes : +help"))
+    importer.warm_up(LAZY_MODULES)
+    graph.warm_up()
 
 
 @bot.event